@@ -1,18 +1,31 @@
 import os
+import sys
+import argparse
 import json
-import copy
+import io
 import time
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
+from array import array
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
-from typing import Type, List, Optional, Any, Dict, Union
+from collections import defaultdict
+from typing import Type, List, Optional, Any, Dict, Tuple, Union, Iterable, Iterator
 
 # Для PostgreSQL
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Connection as SQLAConnection
 import psycopg2
+from psycopg2.extras import execute_batch
 
 # Импортируем Pydantic модели
 try:
@@ -33,7 +46,7 @@ try:
         GeozoneInfoSchema,
         DriverInfoSchema,
         AuthLoginResponseSchema,
-        VehicleListItemSchema,
+        VehicleListIdsSchema,
         VehicleDetailResponseSchema,
         VehicleCustomFieldSchema,
         VehicleCountersSchema,
@@ -46,7 +59,8 @@ try:
         VehicleCommandTemplateSchema,
         VehicleInspectionTaskSchema,
     )
-    from pydantic import ValidationError, BaseModel as PydanticBaseModel
+    from pydantic import ValidationError, TypeAdapter, BaseModel as PydanticBaseModel
+    from pydantic_core import from_json, to_json
 except ImportError as e:
     print(f"Ошибка: Не удалось импортировать модели: {e}")
     print(
@@ -63,10 +77,25 @@ BASE_URL = os.getenv("API_BASE_URL", "https://hosting.glonasssoft.ru/api/v3")
 
 REQUEST_DELAY_SECONDS = 5
 DETAIL_REQUEST_DELAY_SECONDS = 7
+REQUEST_BURST = 3
 MAX_RETRIES = 5
 RETRY_DELAY_BASE_SECONDS = 10
 DAYS_FOR_REPORTS = 30
 API_TIMEOUT_SECONDS = 120
+HTTP_POOL_SIZE = 16
+# Повторы на уровне соединения (обрыв TCP/TLS до отправки запроса); 429 обрабатывается отдельно
+HTTP_CONNECT_RETRIES = 3
+HTTP_CONNECT_BACKOFF_SECONDS = 0.3
+# Дисковый кэш ответов API (выключен при API_CACHE_TTL_SECONDS=0); ключ включает
+# тело запроса, поэтому отчеты с периодом до текущего времени из кэша не берутся
+API_CACHE_FILE = os.getenv("API_CACHE_FILE", ".api_cache.sqlite")
+API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", 0))
+DETAIL_MAX_WORKERS = 8
+# Сколько запросов одновременно поставлено в пул: ответы не копятся в памяти,
+# а при прерывании отменяется только небольшое окно
+DETAIL_MAX_PENDING_REQUESTS = 2 * DETAIL_MAX_WORKERS
+# Детали ТС фиксируются в БД одной транзакцией на каждые N ТС
+DETAIL_COMMIT_EVERY_VEHICLES = 50
 
 LOG_FILE = "api_calls_ru_validated_db.log"
 
@@ -79,6 +108,7 @@ PG_PORT = int(os.getenv("PG_PORT", 5432))
 PG_DB_NAME = os.getenv("PG_DB_NAME", "glonass_db")
 PG_USER = os.getenv("PG_USER", "glonass_user")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "glonass_password")
+DB_POOL_SIZE = 8
 
 
 # --- Настройка логирования ---
@@ -123,24 +153,53 @@ def quote_identifier(name: str) -> str:
 
 
 # --- Функции работы с БД ---
+# Настройки SQLite для разовой массовой загрузки: WAL без fsync на каждую
+# транзакцию, временные таблицы в памяти, кэш ~200 МБ и mmap 256 МБ
+SQLITE_BULK_LOAD_PRAGMAS = (
+    "journal_mode = WAL",
+    "synchronous = NORMAL",
+    "temp_store = MEMORY",
+    "cache_size = -200000",
+    "mmap_size = 268435456",
+)
+
+
+@lru_cache(maxsize=None)
+def get_pg_engine():
+    """
+    Возвращает единственный на процесс Engine PostgreSQL: соединения берутся
+    из его пула, а не открываются заново (TCP, TLS, аутентификация) на каждый вызов.
+    """
+    db_url = f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}"
+    return create_engine(db_url, pool_size=DB_POOL_SIZE, pool_pre_ping=True)
+
+
 def get_db_connection() -> Optional[DBConnection]:
     """Устанавливает соединение с БД SQLite или PostgreSQL."""
     conn = None
     if DB_TYPE == "sqlite":
         try:
-            conn = sqlite3.connect(SQLITE_DB_FILE)
+            # Без неявных транзакций модуля sqlite3: BEGIN/COMMIT выполняются
+            # явно (db_transaction, insert_rows), вне их - режим autocommit
+            conn = sqlite3.connect(SQLITE_DB_FILE, isolation_level=None)
             conn.row_factory = sqlite3.Row
             logger.debug(f"Установлено соединение с SQLite: {SQLITE_DB_FILE}")
             conn.execute("PRAGMA foreign_keys = ON")
+            for pragma in SQLITE_BULK_LOAD_PRAGMAS:
+                conn.execute(f"PRAGMA {pragma}")
+            # WAL может не включиться (например, БД в памяти или на сетевом диске)
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if journal_mode.lower() != "wal":
+                logger.warning(
+                    f"SQLite: режим WAL не включен, используется journal_mode={journal_mode}."
+                )
             return conn
         except sqlite3.Error as e:
             logger.error(f"Ошибка соединения с SQLite: {e}")
             return None
     elif DB_TYPE == "postgres":
         try:
-            db_url = f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}"
-            engine = create_engine(db_url)
-            conn = engine.connect()
+            conn = get_pg_engine().connect()
             logger.debug(
                 f"Установлено соединение с PostgreSQL: {PG_DB_NAME}@{PG_HOST}:{PG_PORT}"
             )
@@ -157,37 +216,67 @@ def get_db_connection() -> Optional[DBConnection]:
         return None
 
 
+def get_missing_tables(conn: DBConnection) -> List[str]:
+    """Возвращает таблицы схемы, которых еще нет в БД (один запрос к каталогу)."""
+    table_names = list(TABLE_UNIQUE_COLUMNS)
+    if isinstance(conn, sqlite3.Connection):
+        existing = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        return [name for name in table_names if name not in existing]
+    return [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT name FROM unnest(CAST(:names AS text[])) AS name "
+                "WHERE to_regclass(quote_ident(name)) IS NULL"
+            ),
+            {"names": table_names},
+        )
+    ]
+
+
 def create_tables(conn: DBConnection):
     """
     Создает таблицы в БД, если они не существуют.
     Адаптирует SQL синтаксис под SQLite или PostgreSQL.
+    Для таблиц из DEFERRED_UNIQUE_TABLES ограничение UNIQUE не создается:
+    уникальный индекс строится после загрузки (create_deferred_unique_indexes).
+    Если все таблицы уже есть, DDL не выполняется.
     """
     if not conn:
         return
 
     is_sqlite = isinstance(conn, sqlite3.Connection)
 
+    if not get_missing_tables(conn):
+        if not is_sqlite:
+            # Закрываем транзакцию, открытую запросом к каталогу
+            conn.rollback()
+        logger.info("Все таблицы уже существуют, создание таблиц пропущено.")
+        return
+
+    def execute_ddl(sql: str):
+        # sqlite3 принимает строку, SQLAlchemy - конструкцию text()
+        conn.execute(sql if is_sqlite else text(sql))
+
     try:
         # Справочники (должны создаваться и заполняться ПЕРВЫМИ)
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""CREATE TABLE IF NOT EXISTS {quote_identifier('device_types')} ({quote_identifier('deviceTypeId')} INTEGER PRIMARY KEY, {quote_identifier('deviceTypeName')} {get_text_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL)"""
-            )
         )
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""CREATE TABLE IF NOT EXISTS {quote_identifier('sensor_types')} ({quote_identifier('id')} INTEGER PRIMARY KEY, {quote_identifier('name')} {get_text_sql_type()} UNIQUE, {quote_identifier('description')} {get_text_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL)"""
-            )
         )
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""CREATE TABLE IF NOT EXISTS {quote_identifier('drivers')} ({quote_identifier('id')} {get_text_sql_type()} PRIMARY KEY, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('description')} {get_text_sql_type()}, {quote_identifier('hiredate')} {get_text_sql_type()}, {quote_identifier('chopdate')} {get_text_sql_type()}, {quote_identifier('exclusive')} {get_boolean_sql_type()}, {quote_identifier('parentId')} {get_text_sql_type()}, {quote_identifier('deleted')} {get_boolean_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL)"""
-            )
         )
 
         # Основная таблица ТС
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""
             CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_details')} (
                 {quote_identifier('vehicleId')} INTEGER PRIMARY KEY, {quote_identifier('vehicleGuid')} {get_text_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('imei')} {get_text_sql_type()},
@@ -208,17 +297,13 @@ def create_tables(conn: DBConnection):
                 FOREIGN KEY ({quote_identifier('deviceTypeId')}) REFERENCES {quote_identifier('device_types')}({quote_identifier('deviceTypeId')}) ON DELETE SET NULL ON UPDATE CASCADE
             )
         """
-            )
         )
         # Связанные с vehicle_details таблицы
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_custom_fields_detail')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('custom_field_id')} {get_text_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('value_text')} {get_text_sql_type()}, {quote_identifier('forTooltip')} {get_boolean_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('custom_field_id')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_custom_fields_detail')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('custom_field_id')} {get_text_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('value_text')} {get_text_sql_type()}, {quote_identifier('forTooltip')} {get_boolean_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('vehicle_custom_fields_detail')})"""
         )
 
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""
             CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_sensors_detail')} (
                 {get_pk_autoincrement_sql()},
@@ -250,203 +335,695 @@ def create_tables(conn: DBConnection):
                 {quote_identifier('medianDegree')} INTEGER,
                 {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL,
                 FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE,
-                FOREIGN KEY ({quote_identifier('sensor_type_id')}) REFERENCES {quote_identifier('sensor_types')}({quote_identifier('id')}) ON DELETE SET NULL ON UPDATE CASCADE,
-                UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('sensor_id')})
+                FOREIGN KEY ({quote_identifier('sensor_type_id')}) REFERENCES {quote_identifier('sensor_types')}({quote_identifier('id')}) ON DELETE SET NULL ON UPDATE CASCADE{unique_constraint_sql('vehicle_sensors_detail')}
             )
         """
-            )
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_drivers_assigned')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('driver_id')} {get_text_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('isDefault')} {get_boolean_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('driver_id')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_drivers_assigned')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('driver_id')} {get_text_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('isDefault')} {get_boolean_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('vehicle_drivers_assigned')})"""
         )
 
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""
             CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_status_history_items')} (
                 {get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL,
                 {quote_identifier('status')} INTEGER, {quote_identifier('date')} {get_text_sql_type()}, {quote_identifier('description')} {get_text_sql_type()}, {quote_identifier('additionalInfo')} {get_text_sql_type()},
                 {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL,
-                UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('date')}, {quote_identifier('status')}, {quote_identifier('description')}, {quote_identifier('additionalInfo')}),
-                FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE
+                FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('vehicle_status_history_items')}
             )
         """
-            )
         )
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_cmsv6_params')}({quote_identifier('vehicleId')} INTEGER PRIMARY KEY, {quote_identifier('cms_id')} {get_text_sql_type()}, {quote_identifier('enabled')} {get_boolean_sql_type()}, {quote_identifier('host')} {get_text_sql_type()}, {quote_identifier('login')} {get_text_sql_type()}, {quote_identifier('password')} {get_text_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE)"""
-            )
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_command_templates')}({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('command_template_id')} {get_text_sql_type()} NOT NULL, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('command')} {get_text_sql_type()}, {quote_identifier('retries')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE ({quote_identifier('vehicleId')}, {quote_identifier('command_template_id')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_command_templates')}({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('command_template_id')} {get_text_sql_type()} NOT NULL, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('command')} {get_text_sql_type()}, {quote_identifier('retries')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('vehicle_command_templates')})"""
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_inspection_tasks')}({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('task_id')} {get_text_sql_type()} NOT NULL, {quote_identifier('enabled')} {get_boolean_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('description')} {get_text_sql_type()}, {quote_identifier('mileageCondition')} REAL, {quote_identifier('lastMileage')} REAL, {quote_identifier('motohoursCondition')} REAL, {quote_identifier('lastMotohours')} REAL, {quote_identifier('periodicCondition')} INTEGER, {quote_identifier('kind')} {get_text_sql_type()}, {quote_identifier('lastInspectionDate')} {get_text_sql_type()}, {quote_identifier('maxQuantity')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE ({quote_identifier('vehicleId')}, {quote_identifier('task_id')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('vehicle_inspection_tasks')}({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER NOT NULL, {quote_identifier('task_id')} {get_text_sql_type()} NOT NULL, {quote_identifier('enabled')} {get_boolean_sql_type()}, {quote_identifier('name')} {get_text_sql_type()}, {quote_identifier('description')} {get_text_sql_type()}, {quote_identifier('mileageCondition')} REAL, {quote_identifier('lastMileage')} REAL, {quote_identifier('motohoursCondition')} REAL, {quote_identifier('lastMotohours')} REAL, {quote_identifier('periodicCondition')} INTEGER, {quote_identifier('kind')} {get_text_sql_type()}, {quote_identifier('lastInspectionDate')} {get_text_sql_type()}, {quote_identifier('maxQuantity')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('vehicle_inspection_tasks')})"""
         )
 
         # Таблицы отчетов, ссылающиеся на vehicle_details
-        conn.execute(
-            text(
+        execute_ddl(
                 f"""CREATE TABLE IF NOT EXISTS {quote_identifier('last_data')} ({quote_identifier('vehicleId')} INTEGER PRIMARY KEY, {quote_identifier('vehicleGuid')} {get_text_sql_type()}, {quote_identifier('vehicleNumber')} {get_text_sql_type()}, {quote_identifier('receiveTime')} {get_text_sql_type()}, {quote_identifier('recordTime')} {get_text_sql_type()}, {quote_identifier('state')} INTEGER, {quote_identifier('speed')} REAL, {quote_identifier('course')} INTEGER, {quote_identifier('latitude')} REAL, {quote_identifier('longitude')} REAL, {quote_identifier('address')} {get_text_sql_type()}, {quote_identifier('geozones')} {get_text_sql_type()}, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE)"""
-            )
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('mileage_motohours')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('period_start')} {get_text_sql_type()}, {quote_identifier('period_end')} {get_text_sql_type()}, {quote_identifier('mileage')} REAL, {quote_identifier('mileageBegin')} REAL, {quote_identifier('mileageEnd')} REAL, {quote_identifier('motohours')} REAL, {quote_identifier('motohoursBegin')} REAL, {quote_identifier('motohoursEnd')} REAL, {quote_identifier('idlingTime')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('period_start')}, {quote_identifier('period_end')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('mileage_motohours')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('period_start')} {get_text_sql_type()}, {quote_identifier('period_end')} {get_text_sql_type()}, {quote_identifier('mileage')} REAL, {quote_identifier('mileageBegin')} REAL, {quote_identifier('mileageEnd')} REAL, {quote_identifier('motohours')} REAL, {quote_identifier('motohoursBegin')} REAL, {quote_identifier('motohoursEnd')} REAL, {quote_identifier('idlingTime')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('mileage_motohours')})"""
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('fuel_consumption')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('period_start')} {get_text_sql_type()}, {quote_identifier('period_end')} {get_text_sql_type()}, {quote_identifier('fuelLevelStart')} REAL, {quote_identifier('fuelLevelEnd')} REAL, {quote_identifier('fuelTankLevelStart')} REAL, {quote_identifier('fuelTankLevelEnd')} REAL, {quote_identifier('fuelConsumption')} REAL, {quote_identifier('fuelConsumptionMove')} REAL, {quote_identifier('fuelConsumptionFactTank')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('period_start')}, {quote_identifier('period_end')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('fuel_consumption')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('period_start')} {get_text_sql_type()}, {quote_identifier('period_end')} {get_text_sql_type()}, {quote_identifier('fuelLevelStart')} REAL, {quote_identifier('fuelLevelEnd')} REAL, {quote_identifier('fuelTankLevelStart')} REAL, {quote_identifier('fuelTankLevelEnd')} REAL, {quote_identifier('fuelConsumption')} REAL, {quote_identifier('fuelConsumptionMove')} REAL, {quote_identifier('fuelConsumptionFactTank')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('fuel_consumption')})"""
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('fuel_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('report_period_start')} {get_text_sql_type()}, {quote_identifier('report_period_end')} {get_text_sql_type()}, {quote_identifier('vehicleModel')} {get_text_sql_type()}, {quote_identifier('event_type')} {get_text_sql_type()}, {quote_identifier('event_startDate')} {get_text_sql_type()}, {quote_identifier('event_endDate')} {get_text_sql_type()}, {quote_identifier('valueFuel')} REAL, {quote_identifier('fuelStart')} REAL, {quote_identifier('fuelEnd')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('event_startDate')}, {quote_identifier('event_type')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('fuel_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('report_period_start')} {get_text_sql_type()}, {quote_identifier('report_period_end')} {get_text_sql_type()}, {quote_identifier('vehicleModel')} {get_text_sql_type()}, {quote_identifier('event_type')} {get_text_sql_type()}, {quote_identifier('event_startDate')} {get_text_sql_type()}, {quote_identifier('event_endDate')} {get_text_sql_type()}, {quote_identifier('valueFuel')} REAL, {quote_identifier('fuelStart')} REAL, {quote_identifier('fuelEnd')} REAL, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('fuel_events')})"""
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('move_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('mileage')} REAL, {quote_identifier('eventId')} INTEGER, {quote_identifier('eventName')} {get_text_sql_type()}, {quote_identifier('event_start')} {get_text_sql_type()}, {quote_identifier('event_end')} {get_text_sql_type()}, {quote_identifier('duration')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('event_start')}, {quote_identifier('eventId')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('move_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('mileage')} REAL, {quote_identifier('eventId')} INTEGER, {quote_identifier('eventName')} {get_text_sql_type()}, {quote_identifier('event_start')} {get_text_sql_type()}, {quote_identifier('event_end')} {get_text_sql_type()}, {quote_identifier('duration')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('move_events')})"""
         )
-        conn.execute(
-            text(
-                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('stop_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('address')} {get_text_sql_type()}, {quote_identifier('eventId')} INTEGER, {quote_identifier('eventName')} {get_text_sql_type()}, {quote_identifier('event_start')} {get_text_sql_type()}, {quote_identifier('event_end')} {get_text_sql_type()}, {quote_identifier('duration')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE, UNIQUE({quote_identifier('vehicleId')}, {quote_identifier('event_start')}, {quote_identifier('eventId')}))"""
-            )
+        execute_ddl(
+                f"""CREATE TABLE IF NOT EXISTS {quote_identifier('stop_events')} ({get_pk_autoincrement_sql()}, {quote_identifier('vehicleId')} INTEGER, {quote_identifier('address')} {get_text_sql_type()}, {quote_identifier('eventId')} INTEGER, {quote_identifier('eventName')} {get_text_sql_type()}, {quote_identifier('event_start')} {get_text_sql_type()}, {quote_identifier('event_end')} {get_text_sql_type()}, {quote_identifier('duration')} INTEGER, {quote_identifier('retrieved_at')} {get_text_sql_type()} NOT NULL, FOREIGN KEY ({quote_identifier('vehicleId')}) REFERENCES {quote_identifier('vehicle_details')}({quote_identifier('vehicleId')}) ON DELETE CASCADE{unique_constraint_sql('stop_events')})"""
         )
 
-        if is_sqlite:
-            conn.commit()
+        conn.commit()
         logger.info("Таблицы в БД успешно созданы/проверены.")
     except Exception as e:
         logger.error(f"Ошибка при создании таблиц в БД: {e}")
         raise  # Перевыбрасываем исключение
 
 
-def insert_data(conn: DBConnection, table_name: str, data: dict):
-    if not conn or not data:
-        return
-    data_copy = data.copy()
-    data_copy["retrieved_at"] = datetime.now(timezone.utc).isoformat()
+# Карта уникальных колонок таблиц (для ON CONFLICT в PostgreSQL)
+TABLE_UNIQUE_COLUMNS: Dict[str, List[str]] = {
+    "device_types": ["deviceTypeId"],
+    "sensor_types": ["id"],
+    "drivers": ["id"],
+    "vehicle_details": ["vehicleId"],
+    "vehicle_custom_fields_detail": ["vehicleId", "custom_field_id"],
+    "vehicle_sensors_detail": ["vehicleId", "sensor_id"],
+    "vehicle_drivers_assigned": ["vehicleId", "driver_id"],
+    "vehicle_status_history_items": [
+        "vehicleId",
+        "date",
+        "status",
+        "description",
+        "additionalInfo",
+    ],
+    "vehicle_cmsv6_params": ["vehicleId"],
+    "vehicle_command_templates": ["vehicleId", "command_template_id"],
+    "vehicle_inspection_tasks": ["vehicleId", "task_id"],
+    "last_data": ["vehicleId"],
+    "mileage_motohours": ["vehicleId", "period_start", "period_end"],
+    "fuel_consumption": ["vehicleId", "period_start", "period_end"],
+    "fuel_events": ["vehicleId", "event_startDate", "event_type"],
+    "move_events": ["vehicleId", "event_start", "eventId"],
+    "stop_events": ["vehicleId", "event_start", "eventId"],
+}
+
+# Таблицы с суррогатным id, уникальность которых задается отдельным UNIQUE:
+# при массовой загрузке (--bulk-load) его индекс можно построить после вставки
+DEFERRABLE_UNIQUE_TABLES = (
+    "vehicle_custom_fields_detail",
+    "vehicle_sensors_detail",
+    "vehicle_drivers_assigned",
+    "vehicle_status_history_items",
+    "vehicle_command_templates",
+    "vehicle_inspection_tasks",
+    "mileage_motohours",
+    "fuel_consumption",
+    "fuel_events",
+    "move_events",
+    "stop_events",
+)
+# Таблицы, уникальный индекс которых в текущем запуске отложен до конца загрузки
+DEFERRED_UNIQUE_TABLES: set = set()
+
+
+def unique_constraint_sql(table_name: str) -> str:
+    """Возвращает ", UNIQUE(...)" для CREATE TABLE или пустую строку, если индекс отложен."""
+    if table_name in DEFERRED_UNIQUE_TABLES:
+        return ""
+    unique_cols = ", ".join(
+        quote_identifier(col) for col in TABLE_UNIQUE_COLUMNS[table_name]
+    )
+    return f", UNIQUE({unique_cols})"
 
-    is_sqlite = isinstance(conn, sqlite3.Connection)
 
+def build_insert_sql(table_name: str, columns: List[str], is_sqlite: bool) -> str:
+    """
+    Строит UPSERT для указанных колонок: INSERT ... ON CONFLICT DO UPDATE
+    с позиционными параметрами для SQLite и именованными для PostgreSQL.
+    В отличие от INSERT OR REPLACE, существующая строка обновляется на месте,
+    без удаления и каскадного удаления дочерних строк.
+    """
     quoted_table_name = quote_identifier(table_name)
-    columns = ", ".join(quote_identifier(col) for col in data_copy.keys())
-
-    # Адаптация INSERT/REPLACE для PostgreSQL (используя ON CONFLICT)
-    if not is_sqlite:
-        unique_cols_map = {  # Карта уникальных колонок для ON CONFLICT
-            "device_types": ["deviceTypeId"],
-            "sensor_types": ["id"],
-            "drivers": ["id"],
-            "vehicle_details": ["vehicleId"],
-            "vehicle_custom_fields_detail": ["vehicleId", "custom_field_id"],
-            "vehicle_sensors_detail": ["vehicleId", "sensor_id"],
-            "vehicle_drivers_assigned": ["vehicleId", "driver_id"],
-            "vehicle_status_history_items": [
-                "vehicleId",
-                "date",
-                "status",
-                "description",
-                "additionalInfo",
-            ],
-            "vehicle_cmsv6_params": ["vehicleId"],
-            "vehicle_command_templates": ["vehicleId", "command_template_id"],
-            "vehicle_inspection_tasks": ["vehicleId", "task_id"],
-            "last_data": ["vehicleId"],
-            "mileage_motohours": ["vehicleId", "period_start", "period_end"],
-            "fuel_consumption": ["vehicleId", "period_start", "period_end"],
-            "fuel_events": ["vehicleId", "event_startDate", "event_type"],
-            "move_events": ["vehicleId", "event_start", "eventId"],
-            "stop_events": ["vehicleId", "event_start", "eventId"],
-        }
+    quoted_columns = ", ".join(quote_identifier(col) for col in columns)
+    if is_sqlite:
+        values = ", ".join("?" * len(columns))
+    else:
+        values = ", ".join(f":{col}" for col in columns)
 
-        unique_cols = unique_cols_map.get(table_name)
+    if table_name in DEFERRED_UNIQUE_TABLES:
+        # Уникального индекса еще нет, ON CONFLICT не к чему привязать
+        return f"INSERT INTO {quoted_table_name} ({quoted_columns}) VALUES ({values})"
 
-        if unique_cols:
-            conflict_cols = ", ".join(quote_identifier(col)
-                                      for col in unique_cols)
-            # Исключаем PK из списка обновляемых полей
-            update_set_parts = [
-                f"{quote_identifier(k)} = EXCLUDED.{quote_identifier(k)}"
-                for k in data_copy.keys()
-                if k not in unique_cols
-            ]
+    unique_cols = TABLE_UNIQUE_COLUMNS.get(table_name)
+    if not unique_cols:  # Если нет уникальных ключей, то просто INSERT (без ON CONFLICT)
+        logger.warning(
+            f"Таблица {table_name} не имеет определённых уникальных ключей для ON CONFLICT. Используется простой INSERT. Возможны ошибки дублирования."
+        )
+        return f"INSERT INTO {quoted_table_name} ({quoted_columns}) VALUES ({values})"
 
-            if (
-                not update_set_parts
-            ):  # Если обновлять нечего, кроме PK/UNIQUE (например, таблица справочника)
-                sql = f"INSERT INTO {quoted_table_name} ({columns}) VALUES ({', '.join(f':{k}' for k in data_copy.keys())}) ON CONFLICT ({conflict_cols}) DO NOTHING"
-            else:
-                update_set = ", ".join(update_set_parts)
-                sql = f"INSERT INTO {quoted_table_name} ({columns}) VALUES ({', '.join(f':{k}' for k in data_copy.keys())}) ON CONFLICT ({conflict_cols}) DO UPDATE SET {update_set}"
+    return f"INSERT INTO {quoted_table_name} ({quoted_columns}) VALUES ({values}) {build_on_conflict_sql(table_name, columns)}"
 
-            # для SQLAlchemy `text()` с именованными параметрами,
-            # значения передаются словарем
-            params_to_execute = data_copy
 
-        else:  # Если нет уникальных ключей, то просто INSERT (без ON CONFLICT)
-            sql = f"INSERT INTO {quoted_table_name} ({columns}) VALUES ({', '.join(f':{k}' for k in data_copy.keys())})"
-            logger.warning(
-                f"Таблица {table_name} не имеет определённых уникальных ключей для ON CONFLICT. Используется простой INSERT. Возможны ошибки дублирования."
-            )
-            params_to_execute = data_copy
+def build_on_conflict_sql(table_name: str, columns: List[str]) -> str:
+    """Строит ON CONFLICT (уникальные колонки) DO UPDATE SET ... для таблицы."""
+    unique_cols = TABLE_UNIQUE_COLUMNS[table_name]
+    conflict_cols = ", ".join(quote_identifier(col) for col in unique_cols)
+    # Исключаем PK из списка обновляемых полей
+    update_set_parts = [
+        f"{quote_identifier(col)} = EXCLUDED.{quote_identifier(col)}"
+        for col in columns
+        if col not in unique_cols
+    ]
+    if not update_set_parts:  # Если обновлять нечего, кроме PK/UNIQUE (например, таблица справочника)
+        return f"ON CONFLICT ({conflict_cols}) DO NOTHING"
+    update_set = ", ".join(update_set_parts)
+    return f"ON CONFLICT ({conflict_cols}) DO UPDATE SET {update_set}"
+
+
+@contextmanager
+def db_transaction(conn: DBConnection):
+    """
+    Выполняет блок записей в одной транзакции: COMMIT при успехе,
+    ROLLBACK и повторный выброс исключения при ошибке.
+    Для SQLite транзакция открывается явным BEGIN IMMEDIATE.
+    """
+    begin_transaction(conn)
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def begin_transaction(conn: DBConnection):
+    """Открывает транзакцию SQLite, если она еще не открыта (SQLAlchemy начинает ее сам)."""
+    if isinstance(conn, sqlite3.Connection) and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+@contextmanager
+def db_savepoint(conn: DBConnection, name: str):
+    """
+    Выполняет блок внутри точки сохранения текущей транзакции: при ошибке
+    откатываются только изменения блока, исключение пробрасывается.
+    """
+    if not isinstance(conn, sqlite3.Connection):
+        with conn.begin_nested():
+            yield conn
+        return
+    conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield conn
+    except Exception:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    else:
+        conn.execute(f"RELEASE {name}")
+
+
+# Таблицы событий, которые в SQLite загружаются через временную таблицу
+SQLITE_STAGED_TABLES = {"move_events", "stop_events"}
+
+
+def insert_rows_staged_sqlite(
+    conn: sqlite3.Connection,
+    table_name: str,
+    columns: Tuple[str, ...],
+    rows: List[tuple],
+):
+    """
+    Загружает строки в SQLite через временную таблицу tmp_<таблица>:
+    executemany во временную таблицу и перенос в основную одним
+    INSERT ... SELECT. Транзакция открывается, если еще не открыта,
+    фиксирует ее вызывающий код.
+    """
+    staging_table = f"tmp_{table_name}"
+    column_list = ", ".join(columns)
+    order_by = ", ".join(TABLE_UNIQUE_COLUMNS.get(table_name, columns[:1]))
+    on_conflict = (
+        ""
+        if table_name in DEFERRED_UNIQUE_TABLES
+        else build_on_conflict_sql(table_name, list(columns))
+    )
+    conn.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} AS SELECT * FROM {table_name} LIMIT 0"
+    )
+    begin_transaction(conn)
+    conn.executemany(
+        f"INSERT INTO {staging_table} ({column_list}) VALUES ({', '.join('?' * len(columns))})",
+        rows,
+    )
+    conn.execute(
+        f"""
+        INSERT INTO {table_name} ({column_list})
+            SELECT {column_list} FROM {staging_table} WHERE true ORDER BY {order_by}
+            {on_conflict}
+        """
+    )
+    conn.execute(f"DELETE FROM {staging_table}")
+
+
+# Таблицы отчетов, которые в PostgreSQL загружаются через COPY во временную таблицу
+PG_COPY_TABLES = {
+    "mileage_motohours",
+    "fuel_consumption",
+    "fuel_events",
+    "move_events",
+    "stop_events",
+}
+
+
+def _copy_text_value(value: Any) -> str:
+    """Значение поля в текстовом формате COPY: \\N для NULL, экранирование спецсимволов."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        # Логические поля хранятся в колонках INTEGER
+        return "1" if value else "0"
+    if isinstance(value, str):
+        return (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    return str(value)
+
+
+def insert_rows_copy_pg(
+    conn: SQLAConnection,
+    table_name: str,
+    columns: Tuple[str, ...],
+    rows: List[tuple],
+):
+    """
+    Загружает строки в PostgreSQL через COPY FROM STDIN во временную таблицу
+    tmp_<таблица> и перенос в основную одним INSERT ... SELECT ... ON CONFLICT.
+    Из повторов по уникальным колонкам внутри пакета берется последняя строка,
+    как при построчном UPSERT.
+    """
+    staging_table = quote_identifier(f"tmp_{table_name}")
+    column_list = ", ".join(quote_identifier(col) for col in columns)
+    unique_cols = [quote_identifier(col) for col in TABLE_UNIQUE_COLUMNS[table_name]]
+    conn.execute(
+        text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} ON COMMIT DELETE ROWS "
+            f"AS SELECT {column_list} FROM {quote_identifier(table_name)} WITH NO DATA"
+        )
+    )
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(_copy_text_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {staging_table} ({column_list}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+    # Строки с NULL в уникальных колонках, как и для UNIQUE, повторами не считаются
+    has_null_key = " OR ".join(f"{col} IS NULL" for col in unique_cols)
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {quote_identifier(table_name)} ({column_list})
+                SELECT {column_list} FROM (
+                    SELECT {column_list},
+                        row_number() OVER (PARTITION BY {', '.join(unique_cols)} ORDER BY ctid DESC) AS rn,
+                        ({has_null_key}) AS has_null_key
+                    FROM {staging_table}
+                ) AS staged
+                WHERE rn = 1 OR has_null_key
+            {build_on_conflict_sql(table_name, list(columns))}
+            """
+        )
+    )
+    conn.execute(text(f"DELETE FROM {staging_table}"))
+
 
-    else:  # SQLite (INSERT OR REPLACE)
-        placeholders = ", ".join("?" * len(data_copy))
-        sql = f"INSERT OR REPLACE INTO {quoted_table_name} ({columns}) VALUES ({placeholders})"
-        # Для SQLite значения передаются списком
-        params_to_execute = list(data_copy.values())
+# Число EXECUTE подготовленного запроса, отправляемых в PostgreSQL за один обмен
+PG_EXECUTE_BATCH_PAGE_SIZE = 200
 
+
+def insert_rows_prepared_pg(
+    conn: SQLAConnection,
+    table_name: str,
+    columns: Tuple[str, ...],
+    rows: List[tuple],
+):
+    """
+    Вставляет строки в PostgreSQL подготовленным запросом: PREPARE выполняется
+    один раз на соединение, затем EXECUTE пачками через execute_batch, без
+    разбора и планирования UPSERT на каждую строку и без обмена на каждую строку.
+    """
+    statement_name = f"ins_{table_name}"
+    if not conn.in_transaction():
+        # Курсор DBAPI используется напрямую: транзакцию SQLAlchemy открываем явно,
+        # чтобы последующий conn.commit() зафиксировал вставку
+        conn.begin()
+    # info живет вместе с DBAPI-соединением в пуле SQLAlchemy
+    prepared_statements = conn.connection.info.setdefault("prepared_statements", set())
+    cursor = conn.connection.cursor()
     try:
-        if is_sqlite:
-            cursor = conn.cursor()
+        if statement_name not in prepared_statements:
+            column_list = ", ".join(quote_identifier(col) for col in columns)
+            params = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
             cursor.execute(
-                sql, params_to_execute
-            )  
+                f"PREPARE {statement_name} AS INSERT INTO {quote_identifier(table_name)} "
+                f"({column_list}) VALUES ({params}) {build_on_conflict_sql(table_name, list(columns))}"
+            )
+            prepared_statements.add(statement_name)
+        execute_batch(
+            cursor,
+            f"EXECUTE {statement_name} ({', '.join(['%s'] * len(columns))})",
+            rows,
+            page_size=PG_EXECUTE_BATCH_PAGE_SIZE,
+        )
+    finally:
+        cursor.close()
+
+
+# Таблицы, которые в SQLite вставляются многострочным VALUES
+SQLITE_MULTI_VALUES_TABLES = {
+    "vehicle_sensors_detail",
+    "mileage_motohours",
+    "fuel_consumption",
+    "fuel_events",
+    "last_data",
+}
+# Ограничение SQLite на число параметров в одном запросе, если его нельзя узнать
+# у соединения (до Python 3.11); сборки SQLite 3.32+ допускают 32766
+SQLITE_MAX_VARIABLES = 999
+# Верхняя граница строк в одном многострочном INSERT
+SQLITE_MAX_ROWS_PER_STATEMENT = 500
+
+
+def get_sqlite_max_variables(conn: Union[sqlite3.Connection, sqlite3.Cursor]) -> int:
+    """Возвращает ограничение SQLite на число параметров запроса для соединения."""
+    connection = conn.connection if isinstance(conn, sqlite3.Cursor) else conn
+    getlimit = getattr(connection, "getlimit", None)  # Python 3.11+
+    if getlimit is None:
+        return SQLITE_MAX_VARIABLES
+    return getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+
+def insert_rows_multi_values_sqlite(
+    conn: Union[sqlite3.Connection, sqlite3.Cursor], table_name: str, rows: List[tuple]
+):
+    """
+    Вставляет строки в SQLite запросами INSERT ... VALUES (...), (...), ...
+    по столько строк, сколько помещается в ограничение SQLite на число
+    параметров (не больше SQLITE_MAX_ROWS_PER_STATEMENT). Полные пакеты
+    выполняются одним и тем же запросом, остаток - еще одним запросом.
+    """
+    single_row_sql, columns = TABLE_SQL[table_name]
+    rows_per_statement = max(
+        1,
+        min(
+            get_sqlite_max_variables(conn) // len(columns),
+            SQLITE_MAX_ROWS_PER_STATEMENT,
+        ),
+    )
+    row_placeholders = f"({', '.join('?' * len(columns))})"
+    for start in range(0, len(rows), rows_per_statement):
+        chunk = rows[start : start + rows_per_statement]
+        sql = single_row_sql.replace(
+            f"VALUES {row_placeholders}",
+            "VALUES " + ", ".join([row_placeholders] * len(chunk)),
+        )
+        conn.execute(sql, [value for row in chunk for value in row])
+
+
+def insert_rows(
+    conn: DBConnection,
+    table_name: str,
+    rows: List[tuple],
+    commit: bool = True,
+    cursor: Optional[sqlite3.Cursor] = None,
+):
+    """
+    Пакетно вставляет строки в таблицу одним executemany заранее
+    подготовленного запроса из TABLE_SQL.
+    Каждая строка - кортеж значений в порядке колонок таблицы в TABLE_SQL.
+    С commit=False пакет остается в текущей транзакции, ошибка пробрасывается.
+    Для SQLite можно передать открытый курсор, чтобы не создавать новый на каждый вызов.
+    """
+    if not conn or not rows:
+        return
+    is_sqlite = isinstance(conn, sqlite3.Connection)
+    sql, columns = TABLE_SQL[table_name]
+    try:
+        if is_sqlite and commit and table_name in SQLITE_STAGED_TABLES:
+            insert_rows_staged_sqlite(conn, table_name, columns, rows)
             conn.commit()
+        elif is_sqlite:
+            if commit and not conn.in_transaction:
+                # В режиме autocommit без явной транзакции каждая строка фиксировалась бы отдельно
+                conn.execute("BEGIN")
+            if table_name in SQLITE_MULTI_VALUES_TABLES:
+                insert_rows_multi_values_sqlite(cursor or conn, table_name, rows)
+            else:
+                (cursor or conn).executemany(sql, rows)
+            if commit:
+                conn.commit()
+        elif table_name in PG_COPY_TABLES:
+            insert_rows_copy_pg(conn, table_name, columns, rows)
+            if commit:
+                conn.commit()
         else:  # PostgreSQL (SQLAlchemy)
-            conn.execute(text(sql), params_to_execute)
-            conn.commit()
-
-        log_id_val = next(
-            (
-                data_copy[key]
-                for key in [
-                    "id",
-                    "vehicleId",
-                    "deviceTypeId",
-                    "custom_field_id",
-                    "sensor_id",
-                    "driver_id",
-                    "command_template_id",
-                    "task_id",
-                ]
-                if key in data_copy
-            ),
-            "N/A",
-        )
+            insert_rows_prepared_pg(conn, table_name, columns, rows)
+            if commit:
+                conn.commit()
         logger.debug(
-            f"Данные успешно вставлены/обновлены в таблицу {table_name} (ID/ключ: {log_id_val})"
+            f"В таблицу {table_name} пакетно вставлено/обновлено {len(rows)} строк"
         )
     except Exception as e:
         logger.error(
-            f"Ошибка при вставке данных в таблицу {table_name}: {e}\nSQL: {sql}\nДанные: {data_copy}"
+            f"Ошибка при пакетной вставке в таблицу {table_name}: {e}\nSQL: {sql}\nСтрок: {len(rows)}"
         )
-        if not is_sqlite:
-            try:
+        if not commit:
+            raise
+        try:
+            if not is_sqlite or conn.in_transaction:
                 conn.rollback()
-            except Exception as rb_e:
-                logger.error(f"Ошибка при rollback транзакции: {rb_e}")
+            if is_sqlite and table_name in SQLITE_STAGED_TABLES:
+                # Недогруженная временная таблица будет создана заново
+                conn.execute(f"DROP TABLE IF EXISTS temp.tmp_{table_name}")
+        except Exception as rb_e:
+            logger.error(f"Ошибка при rollback транзакции: {rb_e}")
+
+
+# --- Разбор ответов отчетов в строки таблиц ---
+# Описание отчетов: (путь, схема элемента ответа, вложенный список, схема записи,
+# таблица, колонки из полей элемента ответа, колонки из полей записи).
+# Колонка задается парой (имя колонки в БД, имя атрибута модели).
+_REPORT_ROW_SPECS = (
+    (
+        "/vehicles/mileageAndMotohours",
+        VehicleMileageMotohoursDataSchema,
+        "periods",
+        MileageMotohoursPeriodSchema,
+        "mileage_motohours",
+        (("vehicleId", "vehicleId"),),
+        (
+            ("period_start", "start"),
+            ("period_end", "end"),
+            ("mileage", "mileage"),
+            ("mileageBegin", "mileageBegin"),
+            ("mileageEnd", "mileageEnd"),
+            ("motohours", "motohours"),
+            ("motohoursBegin", "motohoursBegin"),
+            ("motohoursEnd", "motohoursEnd"),
+            ("idlingTime", "idlingTime"),
+        ),
+    ),
+    (
+        "/vehicles/fuelConsumption",
+        VehicleFuelConsumptionDataSchema,
+        "periods",
+        FuelConsumptionPeriodSchema,
+        "fuel_consumption",
+        (("vehicleId", "vehicleId"),),
+        (
+            ("period_start", "start"),
+            ("period_end", "end"),
+            ("fuelLevelStart", "fuelLevelStart"),
+            ("fuelLevelEnd", "fuelLevelEnd"),
+            ("fuelTankLevelStart", "fuelTankLevelStart"),
+            ("fuelTankLevelEnd", "fuelTankLevelEnd"),
+            ("fuelConsumption", "fuelConsumption"),
+            ("fuelConsumptionMove", "fuelConsumptionMove"),
+            ("fuelConsumptionFactTank", "fuelConsumptionFactTank"),
+        ),
+    ),
+    (
+        "/vehicles/fuelInOut",
+        VehicleFuelInOutDataSchema,
+        "fuels",
+        FuelEventSchema,
+        "fuel_events",
+        (
+            ("vehicleId", "vehicleId"),
+            ("report_period_start", "start"),
+            ("report_period_end", "end"),
+            ("vehicleModel", "model"),
+        ),
+        (
+            ("event_type", "event"),
+            ("event_startDate", "startDate"),
+            ("event_endDate", "endDate"),
+            ("valueFuel", "valueFuel"),
+            ("fuelStart", "fuelStart"),
+            ("fuelEnd", "fuelEnd"),
+        ),
+    ),
+    (
+        "/vehicles/moveStop",
+        VehicleMoveStopDataSchema,
+        "moves",
+        MoveEventSchema,
+        "move_events",
+        (("vehicleId", "vehicleId"),),
+        (
+            ("mileage", "mileage"),
+            ("eventId", "eventId"),
+            ("eventName", "eventName"),
+            ("event_start", "start"),
+            ("event_end", "end"),
+            ("duration", "duration"),
+        ),
+    ),
+    (
+        "/vehicles/moveStop",
+        VehicleMoveStopDataSchema,
+        "stops",
+        StopEventSchema,
+        "stop_events",
+        (("vehicleId", "vehicleId"),),
+        (
+            ("address", "address"),
+            ("eventId", "eventId"),
+            ("eventName", "eventName"),
+            ("event_start", "start"),
+            ("event_end", "end"),
+            ("duration", "duration"),
+        ),
+    ),
+)
+
+
+def _compile_report_row_handlers() -> Tuple[
+    Dict[str, Any], Dict[str, Tuple[str, ...]]
+]:
+    """
+    Генерирует для каждого пути отчета функцию handler(items, retrieved_at, batch),
+    которая без промежуточных словарей раскладывает записи ответа в кортежи
+    и добавляет их в batch[таблица].
+    Возвращает (обработчики по путям, колонки по таблицам).
+    """
+    specs_by_path: Dict[str, list] = {}
+    table_columns: Dict[str, Tuple[str, ...]] = {}
+    for path, item_schema, list_attr, row_schema, table, item_cols, row_cols in _REPORT_ROW_SPECS:
+        # Имена атрибутов подставляются в исходный код - проверяем их по схемам
+        for schema, attrs in (
+            (item_schema, [list_attr] + [attr for _, attr in item_cols]),
+            (row_schema, [attr for _, attr in row_cols]),
+        ):
+            unknown = [attr for attr in attrs if attr not in schema.model_fields]
+            if unknown:
+                raise ValueError(f"{schema.__name__} не содержит полей {unknown}")
+        table_columns[table] = tuple(
+            col for col, _ in item_cols + row_cols) + ("retrieved_at",)
+        specs_by_path.setdefault(path, []).append(
+            (table, list_attr, item_cols, row_cols))
+
+    handlers: Dict[str, Any] = {}
+    for path, specs in specs_by_path.items():
+        lines = ["def handler(items, retrieved_at, batch):"]
+        for i, (table, _, _, _) in enumerate(specs):
+            lines.append(f"    append_{i} = batch[{table!r}].append")
+        lines.append("    for item in items:")
+        for i, (_, list_attr, item_cols, row_cols) in enumerate(specs):
+            values = [f"item.{attr}" for _, attr in item_cols]
+            values += [f"row.{attr}" for _, attr in row_cols]
+            lines.append(f"        for row in item.{list_attr} or ():")
+            lines.append(
+                f"            append_{i}(({', '.join(values)}, retrieved_at))")
+        namespace: Dict[str, Any] = {}
+        exec("\n".join(lines), namespace)
+        handlers[path] = namespace["handler"]
+    return handlers, table_columns
+
+
+REPORT_ROW_HANDLERS, REPORT_TABLE_COLUMNS = _compile_report_row_handlers()
+
+
+# Колонки справочников (порядок значений в строках)
+DEVICE_TYPE_COLUMNS = ("deviceTypeId", "deviceTypeName", "retrieved_at")
+SENSOR_TYPE_COLUMNS = ("id", "name", "description", "retrieved_at")
+DRIVER_COLUMNS = (
+    "id",
+    "name",
+    "description",
+    "hiredate",
+    "chopdate",
+    "exclusive",
+    "parentId",
+    "deleted",
+    "retrieved_at",
+)
+
+
+def _row_driver(d: DriverInfoSchema, retrieved_at: str) -> tuple:
+    """Строка таблицы drivers в порядке DRIVER_COLUMNS."""
+    return (
+        d.id,
+        d.name,
+        d.description,
+        d.hiredate,
+        d.chopdate,
+        int(bool(d.exclusive)),
+        d.parentId,
+        int(bool(d.deleted)),
+        retrieved_at,
+    )
+
+
+LAST_DATA_COLUMNS = (
+    "vehicleId",
+    "vehicleGuid",
+    "vehicleNumber",
+    "receiveTime",
+    "recordTime",
+    "state",
+    "speed",
+    "course",
+    "latitude",
+    "longitude",
+    "address",
+    "geozones",
+    "retrieved_at",
+)
+
+
+def _row_last_data(item: LastDataObjectSchema, retrieved_at: str) -> tuple:
+    """Строка таблицы last_data в порядке LAST_DATA_COLUMNS."""
+    return (
+        item.vehicleId,
+        item.vehicleGuid,
+        item.vehicleNumber,
+        item.receiveTime,
+        item.recordTime,
+        item.state,
+        item.speed,
+        item.course,
+        item.latitude,
+        item.longitude,
+        item.address,
+        to_json_text(item.geozones) if item.geozones else None,
+        retrieved_at,
+    )
+
+
+def to_json_text(value: Any) -> str:
+    """
+    Сериализует значение (в т.ч. Pydantic-модели и их списки) в компактную
+    JSON-строку силами pydantic-core, без промежуточного model_dump().
+    """
+    return to_json(value, serialize_unknown=True).decode("utf-8")
 
 
 # --- Вспомогательные функции для API запросов ---
@@ -459,6 +1036,219 @@ def pretty_print_json(data: Any) -> str:
     return str(data)
 
 
+class _LazyPrettyJson:
+    """
+    Откладывает pretty_print_json до форматирования записи лога: если запись
+    отброшена по уровню логгера или обработчиков, сериализация не выполняется.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: Any):
+        self.data = data
+
+    def __str__(self) -> str:
+        return pretty_print_json(self.data)
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к API по схеме token bucket (потокобезопасный).
+    Бюджет пополняется на один запрос за min_interval_seconds и копится
+    до burst запросов: пока запас есть, запросы идут без пауз, иначе acquire()
+    ждет ближайшего слота. После 429 penalize() останавливает выдачу слотов
+    на время ожидания и временно вдвое снижает скорость пополнения.
+    """
+
+    def __init__(
+        self,
+        min_interval_seconds: float,
+        burst: int = 1,
+        penalty_window_seconds: float = 60,
+    ):
+        self.min_interval_seconds = min_interval_seconds
+        self.burst = max(1, burst)
+        self.penalty_window_seconds = penalty_window_seconds
+        self._lock = threading.Lock()
+        # Теоретическое время следующего запроса без учета накопленного запаса
+        self._next_slot = 0.0
+        self._slowdown_until = 0.0
+
+    def acquire(self, interval_seconds: Optional[float] = None):
+        interval = (
+            self.min_interval_seconds
+            if interval_seconds is None
+            else interval_seconds
+        )
+        with self._lock:
+            now = time.monotonic()
+            if now < self._slowdown_until:
+                interval *= 2
+            burst_allowance = (self.burst - 1) * self.min_interval_seconds
+            slot = max(now, self._next_slot - burst_allowance)
+            self._next_slot = max(self._next_slot, now) + interval
+        wait_time = slot - now
+        if wait_time > 0:
+            logger.debug(f"Ограничение частоты: ожидание {wait_time:.2f}с")
+            time.sleep(wait_time)
+
+    def penalize(self, wait_seconds: float):
+        """Реакция на 429: пауза для всех потоков и временное замедление."""
+        with self._lock:
+            now = time.monotonic()
+            # Запас burst не должен сократить паузу после 429
+            burst_allowance = (self.burst - 1) * self.min_interval_seconds
+            self._next_slot = max(
+                self._next_slot, now + wait_seconds + burst_allowance
+            )
+            self._slowdown_until = max(
+                self._slowdown_until,
+                now + wait_seconds + self.penalty_window_seconds,
+            )
+
+
+API_RATE_LIMITER = RateLimiter(REQUEST_DELAY_SECONDS, burst=REQUEST_BURST)
+
+# Общая HTTP-сессия: keep-alive и пул соединений вместо нового TCP+TLS на каждый запрос
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(
+            total=HTTP_CONNECT_RETRIES,
+            connect=HTTP_CONNECT_RETRIES,
+            read=0,
+            # Ответы 429/503 не повторяются внутри urllib3: их ожидание должно
+            # пройти через API_RATE_LIMITER.penalize в make_api_request
+            status=0,
+            other=0,
+            respect_retry_after_header=False,
+            backoff_factor=HTTP_CONNECT_BACKOFF_SECONDS,
+        ),
+    ),
+)
+SESSION.headers.update({"Content-Type": "application/json"})
+
+
+class ResponseCache:
+    """
+    Дисковый кэш успешных (2xx) ответов API в отдельном файле SQLite.
+    Ключ - метод, URL, параметры и тело запроса; запись действительна
+    ttl_seconds секунд. При ttl_seconds <= 0 кэш выключен.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(
+        method: str,
+        url: str,
+        params: Optional[dict],
+        json_data: Optional[Union[dict, list]],
+    ) -> str:
+        return json.dumps(
+            [method, url, params, json_data], sort_keys=True, ensure_ascii=False
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение используется из потоков Этапа 2, доступ - под self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, status_code INTEGER, content BLOB, stored_at REAL)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT status_code, content, stored_at FROM response_cache WHERE key = ?",
+                    (key,),
+                )
+                .fetchone()
+            )
+        if row is None or time.time() - row[2] > self.ttl_seconds:
+            return None
+        return row[0], bytes(row[1])
+
+    def set(self, key: str, status_code: int, content: bytes):
+        if not 200 <= status_code < 300:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, status_code, content, stored_at) VALUES (?, ?, ?, ?)",
+                (key, status_code, content, time.time()),
+            )
+            conn.commit()
+
+    def clear(self):
+        """Удаляет все сохраненные ответы (флаг --refresh)."""
+        if not os.path.exists(self.path):
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM response_cache")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+API_RESPONSE_CACHE = ResponseCache(API_CACHE_FILE, API_CACHE_TTL_SECONDS)
+
+
+# Кэш TypeAdapter по (модель, список ли): адаптеры строятся один раз на модель
+_TYPE_ADAPTERS: Dict[Tuple[Type[PydanticBaseModel], bool], TypeAdapter] = {}
+
+
+def get_type_adapter(
+    model: Type[PydanticBaseModel], as_list: bool = False
+) -> TypeAdapter:
+    """Возвращает закэшированный TypeAdapter для модели или списка моделей."""
+    key = (model, as_list)
+    adapter = _TYPE_ADAPTERS.get(key)
+    if adapter is None:
+        adapter = TypeAdapter(List[model] if as_list else model)
+        _TYPE_ADAPTERS[key] = adapter
+    return adapter
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает заголовок Retry-After: число секунд или HTTP-дата (RFC 7231).
+    Возвращает время ожидания в секундах или None, если заголовок некорректен.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
 def make_api_request(
     method: str,
     endpoint_path: str,
@@ -467,408 +1257,873 @@ def make_api_request(
     params: Optional[dict] = None,
     response_model: Optional[Type[PydanticBaseModel]] = None,
     response_list_model: Optional[Type[PydanticBaseModel]] = None,
-    current_retries: int = 0,
+    request_interval: Optional[float] = None,
 ) -> Optional[Union[PydanticBaseModel, List[PydanticBaseModel], dict, list, str]]:
     url = f"{BASE_URL}{endpoint_path}"
-    headers = {"Content-Type": "application/json"}
-    if token:
-        headers["X-Auth"] = token
-    log_message_req = f"Запрос {method} {url}\nЗаголовки: {pretty_print_json(headers)}"
+    # Content-Type задан в SESSION, здесь только заголовки конкретного запроса
+    headers = {"X-Auth": token} if token else None
+    logger.info(f"Запрос {method} {url}")
+    # Заголовки и тела логируются только на уровне DEBUG и сериализуются лениво
+    logger.debug("Заголовки %s %s: %s", method, url, _LazyPrettyJson(headers or {}))
     if json_data is not None:
-        log_message_req += f"\nТело запроса: {pretty_print_json(json_data)}"
+        logger.debug("Тело запроса %s %s: %s", method, url, _LazyPrettyJson(json_data))
     if params:
-        log_message_req += f"\nПараметры URL: {pretty_print_json(params)}"
-    logger.info(log_message_req)
-    try:
-        response = requests.request(
-            method,
-            url,
-            headers=headers,
-            json=json_data,
-            params=params,
-            timeout=API_TIMEOUT_SECONDS,
+        logger.debug("Параметры URL %s %s: %s", method, url, _LazyPrettyJson(params))
+
+    # Ответы на запросы с токеном можно взять из дискового кэша (аутентификация не кэшируется)
+    cache_key = (
+        ResponseCache.make_key(method, url, params, json_data)
+        if token and API_RESPONSE_CACHE.enabled
+        else None
+    )
+    cached_response = API_RESPONSE_CACHE.get(cache_key) if cache_key else None
+    if cached_response is not None:
+        status_code, content = cached_response
+        logger.info(f"Ответ {method} {url} {status_code} {len(content)} байт (из кэша)")
+        return parse_api_response(
+            method, url, status_code, content, response_model, response_list_model
         )
-        response.raise_for_status()
-        raw_response_data: Any = None
+
+    request_body = to_json(json_data) if json_data is not None else None
+    for attempt in range(MAX_RETRIES + 1):
+        API_RATE_LIMITER.acquire(request_interval)
+        started_at = time.perf_counter()
         try:
-            raw_response_data = response.json()
-            log_message_resp_body = pretty_print_json(raw_response_data)
-        except json.JSONDecodeError:
-            raw_response_data = response.text
-            log_message_resp_body = (
-                f"(Не JSON): {response.text[:500]}..."
-                if response.text
-                else "(Пустой ответ)"
+            response = SESSION.request(
+                method,
+                url,
+                headers=headers,
+                # Тело сериализуется pydantic-core один раз (Content-Type задан в SESSION)
+                data=request_body,
+                params=params,
+                timeout=API_TIMEOUT_SECONDS,
             )
-        logger.info(
-            f"Ответ от {method} {url}\nСтатус: {response.status_code}\nТело ответа: {log_message_resp_body}"
-        )
-        if raw_response_data is not None and (
-                response_model or response_list_model):
-            try:
-                if response_list_model:
-                    if not isinstance(raw_response_data, list):
-                        logger.error(
-                            f"Ожидался список для {response_list_model.__name__}, получен {type(raw_response_data)}. Ответ: {str(raw_response_data)[:200]}"
-                        )
-                        return None
-                    validated_data = [
-                        response_list_model.model_validate(item)
-                        for item in raw_response_data
-                    ]
-                    logger.info(
-                        f"Ответ успешно валидирован с использованием списка {response_list_model.__name__} ({len(validated_data)} элементов)."
-                    )
-                    return validated_data
-                elif response_model:
-                    validated_data = response_model.model_validate(
-                        raw_response_data)
-                    logger.info(
-                        f"Ответ успешно валидирован с использованием {response_model.__name__}."
-                    )
-                    return validated_data
-            except ValidationError as e:
+            response.raise_for_status()
+            break
+        except requests.exceptions.HTTPError as e:
+            logger.error(
+                f"HTTPError для {method} {url}: {e.response.status_code} - {e.response.text[:500]}"
+            )
+            if e.response.status_code != 429:
+                return None
+            if attempt == MAX_RETRIES:
                 logger.error(
-                    f"Ошибка валидации Pydantic для {method} {url}:\n{e}")
-                problematic_data_excerpt = str(
-                    e.errors(include_input=True))[:1000]
-                logger.debug(
-                    f"Проблемные данные (часть): {problematic_data_excerpt}")
+                    f"Статус 429. Превышено макс. кол-во попыток ({MAX_RETRIES}).")
                 return None
-        return raw_response_data
-    except requests.exceptions.HTTPError as e:
-        logger.error(
-            f"HTTPError для {method} {url}: {e.response.status_code} - {e.response.text[:500]}"
-        )
-        if e.response.status_code == 429 and current_retries < MAX_RETRIES:
-            retry_after_header = e.response.headers.get("Retry-After")
-            wait_time = RETRY_DELAY_BASE_SECONDS * (2**current_retries)
-            if retry_after_header and retry_after_header.isdigit():
-                wait_time = max(wait_time, int(retry_after_header))
+            wait_time = RETRY_DELAY_BASE_SECONDS * (2**attempt)
+            retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+            if retry_after is not None:
+                wait_time = max(wait_time, retry_after)
             logger.warning(
-                f"Получен статус 429. Попытка {current_retries + 1}/{MAX_RETRIES}. Ожидание {wait_time} секунд..."
+                f"Получен статус 429. Попытка {attempt + 1}/{MAX_RETRIES}. Ожидание {wait_time} секунд..."
             )
-            time.sleep(wait_time)
-            return make_api_request(
-                method,
-                endpoint_path,
-                token,
-                json_data,
-                params,
-                response_model,
-                response_list_model,
-                current_retries + 1,
-            )
-        elif e.response.status_code == 429:
+            # Ожидание выдерживает ограничитель частоты при следующем acquire()
+            API_RATE_LIMITER.penalize(wait_time)
+        except requests.exceptions.Timeout:
             logger.error(
-                f"Статус 429. Превышено макс. кол-во попыток ({MAX_RETRIES}).")
-    except requests.exceptions.Timeout:
-        logger.error(
-            f"TimeoutError для {method} {url} (timeout={API_TIMEOUT_SECONDS}s)"
-        )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"RequestException для {method} {url}: {e}")
-    return None
-
+                f"TimeoutError для {method} {url} (timeout={API_TIMEOUT_SECONDS}s)"
+            )
+            return None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"RequestException для {method} {url}: {e}")
+            return None
 
-# --- Функции логики приложения ---
-def authenticate() -> Optional[str]:
-    """Выполняет аутентификацию и возвращает токен."""
-    logger.info("Попытка аутентификации...")
-    payload = {"login": API_LOGIN, "password": API_PASSWORD}
-    response_data = make_api_request(
-        "POST", "/auth/login", json_data=payload, response_model=AuthLoginResponseSchema
+    logger.info(
+        f"Ответ {method} {url} {response.status_code} {len(response.content)} байт "
+        f"{(time.perf_counter() - started_at) * 1000:.0f} мс"
     )
-    if response_data and isinstance(response_data, AuthLoginResponseSchema):
-        logger.info(
-            f"Аутентификация успешна. Пользователь: {response_data.User}")
-        return response_data.AuthId
-    logger.error(
-        "Аутентификация не удалась или ответ не соответствует модели.")
+    if cache_key:
+        API_RESPONSE_CACHE.set(cache_key, response.status_code, response.content)
+    return parse_api_response(
+        method,
+        url,
+        response.status_code,
+        response.content,
+        response_model,
+        response_list_model,
+    )
+
+
+def parse_api_response(
+    method: str,
+    url: str,
+    status_code: int,
+    content: bytes,
+    response_model: Optional[Type[PydanticBaseModel]] = None,
+    response_list_model: Optional[Type[PydanticBaseModel]] = None,
+) -> Optional[Union[PydanticBaseModel, List[PydanticBaseModel], dict, list, str]]:
+    """Разбирает и валидирует тело успешного ответа (из сети или из кэша)."""
+    if response_model or response_list_model:
+        # Валидация сразу из байтов ответа (pydantic-core), без json() -> dict
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Тело ответа от {method} {url}: {content.decode('utf-8', errors='replace') if content else '(Пустой ответ)'}"
+            )
+        target_model = response_list_model or response_model
+        try:
+            validated_data = get_type_adapter(
+                target_model, as_list=response_list_model is not None
+            ).validate_json(content)
+        except ValidationError as e:
+            logger.error(
+                f"Ошибка валидации Pydantic для {method} {url}:\n{e}")
+            problematic_data_excerpt = str(
+                e.errors(include_input=True))[:1000]
+            logger.debug(
+                f"Проблемные данные (часть): {problematic_data_excerpt}")
+            return None
+        if response_list_model:
+            logger.info(
+                f"Ответ успешно валидирован с использованием списка {response_list_model.__name__} ({len(validated_data)} элементов)."
+            )
+        else:
+            logger.info(
+                f"Ответ успешно валидирован с использованием {response_model.__name__}."
+            )
+        return validated_data
+    raw_response_data: Any = None
+    try:
+        # Разбор JSON без модели - тем же парсером pydantic-core, что и validate_json
+        raw_response_data = from_json(content)
+        is_json = True
+    except ValueError:
+        raw_response_data = content.decode("utf-8", errors="replace")
+        is_json = False
+    if is_json:
+        log_message_resp_body = _LazyPrettyJson(raw_response_data)
+    elif raw_response_data:
+        log_message_resp_body = f"(Не JSON): {raw_response_data[:500]}..."
+    else:
+        log_message_resp_body = "(Пустой ответ)"
+    logger.debug(
+        "Тело ответа от %s %s (статус %s): %s",
+        method,
+        url,
+        status_code,
+        log_message_resp_body,
+    )
+    return raw_response_data
+
+
+def iter_api_responses(
+    requests_kwargs: Iterable[Tuple[Any, dict]],
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Выполняет make_api_request в пуле потоков и отдает пары (ключ, ответ) по мере
+    готовности. requests_kwargs - пары (ключ, аргументы make_api_request); в пул
+    ставится не больше DETAIL_MAX_PENDING_REQUESTS запросов, завершенные Future
+    сразу отбрасываются. При выходе из цикла еще не начатые запросы отменяются.
+    """
+    requests_kwargs = iter(requests_kwargs)
+    executor = ThreadPoolExecutor(max_workers=DETAIL_MAX_WORKERS)
+    pending: Dict[Future, Any] = {}
+
+    def submit_next(count: int):
+        for key, kwargs in islice(requests_kwargs, count):
+            pending[executor.submit(make_api_request, **kwargs)] = key
+
+    try:
+        submit_next(DETAIL_MAX_PENDING_REQUESTS)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                submit_next(1)
+                yield key, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# --- Функции логики приложения ---
+def authenticate() -> Optional[str]:
+    """Выполняет аутентификацию и возвращает токен."""
+    logger.info("Попытка аутентификации...")
+    payload = {"login": API_LOGIN, "password": API_PASSWORD}
+    response_data = make_api_request(
+        "POST", "/auth/login", json_data=payload, response_model=AuthLoginResponseSchema
+    )
+    if response_data and isinstance(response_data, AuthLoginResponseSchema):
+        logger.info(
+            f"Аутентификация успешна. Пользователь: {response_data.User}")
+        return response_data.AuthId
+    logger.error(
+        "Аутентификация не удалась или ответ не соответствует модели.")
     return None
 
 
-def get_all_vehicles_with_data(token: str) -> List[VehicleListItemSchema]:
-    """Получает список ВСЕХ доступных транспортных средств с их основными данными."""
-    logger.info("Запрос списка ВСЕХ доступных транспортных средств с данными...")
+def get_all_vehicle_ids(token: str) -> Tuple[array, set]:
+    """
+    Получает идентификаторы ВСЕХ доступных транспортных средств.
+    Ответ /vehicles/find валидируется облегченной моделью (только vehicleId
+    и parentId), результат - компактный массив ID ТС и множество parentId.
+    """
+    logger.info("Запрос списка ВСЕХ доступных транспортных средств...")
     find_payload_for_all_vehicles: Dict[str, Any] = {}
     response_data = make_api_request(
         method="POST",
         endpoint_path="/vehicles/find",
         token=token,
         json_data=find_payload_for_all_vehicles,
-        response_list_model=VehicleListItemSchema,
+        response_list_model=VehicleListIdsSchema,
     )
     if response_data and isinstance(response_data, list):
-        valid_vehicles = [
-            item for item in response_data if isinstance(item, VehicleListItemSchema)
-        ]
-        if len(valid_vehicles) != len(response_data):
-            logger.warning(
-                f"Не все элементы в ответе /vehicles/find являются VehicleListItemSchema. Получено {len(valid_vehicles)} из {len(response_data)}."
-            )
-        logger.info(f"Получено {len(valid_vehicles)} ТС из /vehicles/find.")
-        return valid_vehicles
+        vehicle_ids = array(
+            "q", (v.vehicleId for v in response_data if v.vehicleId is not None)
+        )
+        parent_ids = {v.parentId for v in response_data if v.parentId}
+        logger.info(f"Получено {len(vehicle_ids)} ТС из /vehicles/find.")
+        return vehicle_ids, parent_ids
     logger.error(
         f"Не удалось получить или валидировать список ТС из /vehicles/find. Ответ: {type(response_data)}"
     )
-    return []
-
-
-def save_vehicle_detail_data(
-    conn: DBConnection, detail_data: VehicleDetailResponseSchema
-):
-    """Сохраняет детальную информацию о ТС и связанные с ней данные."""
-    if not conn or not detail_data:
-        return
-    main_data = {
-        "vehicleId": detail_data.vehicleId,
-        "vehicleGuid": detail_data.vehicleGuid,
-        "name": detail_data.name,
-        "imei": detail_data.imei,
-        "deviceTypeId": detail_data.deviceTypeId,
-        "deviceTypeName": detail_data.deviceTypeName,
-        "sim1": detail_data.sim1,
-        "sim2": detail_data.sim2,
-        "parentId": detail_data.parentId,
-        "parentName": detail_data.parentName,
-        "modelId": detail_data.modelId,
-        "modelName": detail_data.modelName,
-        "unitId": detail_data.unitId,
-        "unitName": detail_data.unitName,
-        "status": detail_data.status,
-        "createdAt": detail_data.createdAt,
-        "consumptionPer100Km": (
+    return array("q"), set()
+
+
+# Колонки таблиц детальной информации ТС (порядок значений в строках)
+VEHICLE_DETAIL_COLUMNS = (
+    "vehicleId",
+    "vehicleGuid",
+    "name",
+    "imei",
+    "deviceTypeId",
+    "deviceTypeName",
+    "sim1",
+    "sim2",
+    "parentId",
+    "parentName",
+    "modelId",
+    "modelName",
+    "unitId",
+    "unitName",
+    "status",
+    "createdAt",
+    "consumptionPer100Km",
+    "consumptionPerHour",
+    "locationByCellId",
+    "showLineTrackWhenNoCoords",
+    "IsSackEnabled",
+    "consumptionIdle",
+    "consumptionPer100KmSeasonal",
+    "consumptionPerHourSeasonal",
+    "consumptionIdleSeasonal",
+    "consumptionPer100KmSeasonalBegin",
+    "consumptionPer100KmSeasonalEnd",
+    "consumptionPerHourSeasonalBegin",
+    "consumptionPerHourSeasonalEnd",
+    "consumptionIdleSeasonalBegin",
+    "consumptionIdleSeasonalEnd",
+    "mileageCalcMethod",
+    "mileageCoeff",
+    "dottedLineTrackWhenNoCoords",
+    "highlightSensorGuid",
+    "motohoursCalcMethod",
+    "counter_mileage",
+    "counter_motohours",
+    "counter_mileageTime",
+    "counter_motohoursTime",
+    "retrieved_at",
+)
+CMSV6_COLUMNS = (
+    "vehicleId",
+    "cms_id",
+    "enabled",
+    "host",
+    "login",
+    "password",
+    "retrieved_at",
+)
+CUSTOM_FIELD_COLUMNS = (
+    "vehicleId",
+    "custom_field_id",
+    "name",
+    "value_text",
+    "forTooltip",
+    "retrieved_at",
+)
+SENSOR_COLUMNS = (
+    "vehicleId",
+    "sensor_id",
+    "name",
+    "type_str",
+    "sensor_type_id",
+    "inputType",
+    "inputNumber",
+    "pseudonym",
+    "isInverted",
+    "disabled",
+    "showInTooltip",
+    "showLastValid",
+    "gradeType",
+    "gradesTables_json",
+    "kind",
+    "color",
+    "showAsDutOnGraph",
+    "showWithoutIgn",
+    "agrFunction",
+    "expr",
+    "customParams_json",
+    "summaryMaxValue_text",
+    "valueIntervals_json",
+    "disableEmissionsValidation",
+    "unitOfMeasure",
+    "medianDegree",
+    "retrieved_at",
+)
+ASSIGNED_DRIVER_COLUMNS = (
+    "vehicleId",
+    "driver_id",
+    "name",
+    "isDefault",
+    "retrieved_at",
+)
+STATUS_HISTORY_COLUMNS = (
+    "vehicleId",
+    "status",
+    "date",
+    "description",
+    "additionalInfo",
+    "retrieved_at",
+)
+COMMAND_TEMPLATE_COLUMNS = (
+    "vehicleId",
+    "command_template_id",
+    "name",
+    "command",
+    "retries",
+    "retrieved_at",
+)
+INSPECTION_TASK_COLUMNS = (
+    "vehicleId",
+    "task_id",
+    "enabled",
+    "name",
+    "description",
+    "mileageCondition",
+    "lastMileage",
+    "motohoursCondition",
+    "lastMotohours",
+    "periodicCondition",
+    "kind",
+    "lastInspectionDate",
+    "maxQuantity",
+    "retrieved_at",
+)
+
+
+def _row_vehicle_detail(
+    detail_data: VehicleDetailResponseSchema, retrieved_at: str
+) -> tuple:
+    """Строка vehicle_details в порядке VEHICLE_DETAIL_COLUMNS."""
+    counters = detail_data.counters
+    return (
+        detail_data.vehicleId,
+        detail_data.vehicleGuid,
+        detail_data.name,
+        detail_data.imei,
+        detail_data.deviceTypeId,
+        detail_data.deviceTypeName,
+        detail_data.sim1,
+        detail_data.sim2,
+        detail_data.parentId,
+        detail_data.parentName,
+        detail_data.modelId,
+        detail_data.modelName,
+        detail_data.unitId,
+        detail_data.unitName,
+        detail_data.status,
+        detail_data.createdAt,
+        (
             str(detail_data.consumptionPer100Km)
             if detail_data.consumptionPer100Km is not None
             else None
         ),
-        "consumptionPerHour": (
+        (
             str(detail_data.consumptionPerHour)
             if detail_data.consumptionPerHour is not None
             else None
         ),
-        "locationByCellId": 1 if detail_data.locationByCellId else 0,
-        "showLineTrackWhenNoCoords": 1 if detail_data.showLineTrackWhenNoCoords else 0,
-        "IsSackEnabled": 1 if detail_data.IsSackEnabled else 0,
-        "consumptionIdle": (
+        int(bool(detail_data.locationByCellId)),
+        int(bool(detail_data.showLineTrackWhenNoCoords)),
+        int(bool(detail_data.IsSackEnabled)),
+        (
             str(detail_data.consumptionIdle)
             if detail_data.consumptionIdle is not None
             else None
         ),
-        "consumptionPer100KmSeasonal": detail_data.consumptionPer100KmSeasonal,
-        "consumptionPerHourSeasonal": detail_data.consumptionPerHourSeasonal,
-        "consumptionIdleSeasonal": detail_data.consumptionIdleSeasonal,
-        "consumptionPer100KmSeasonalBegin": detail_data.consumptionPer100KmSeasonalBegin,
-        "consumptionPer100KmSeasonalEnd": detail_data.consumptionPer100KmSeasonalEnd,
-        "consumptionPerHourSeasonalBegin": detail_data.consumptionPerHourSeasonalBegin,
-        "consumptionPerHourSeasonalEnd": detail_data.consumptionPerHourSeasonalEnd,
-        "consumptionIdleSeasonalBegin": detail_data.consumptionIdleSeasonalBegin,
-        "consumptionIdleSeasonalEnd": detail_data.consumptionIdleSeasonalEnd,
-        "mileageCalcMethod": str(detail_data.mileageCalcMethod),
-        "mileageCoeff": detail_data.mileageCoeff,
-        "dottedLineTrackWhenNoCoords": (
-            1 if detail_data.dottedLineTrackWhenNoCoords else 0
+        detail_data.consumptionPer100KmSeasonal,
+        detail_data.consumptionPerHourSeasonal,
+        detail_data.consumptionIdleSeasonal,
+        detail_data.consumptionPer100KmSeasonalBegin,
+        detail_data.consumptionPer100KmSeasonalEnd,
+        detail_data.consumptionPerHourSeasonalBegin,
+        detail_data.consumptionPerHourSeasonalEnd,
+        detail_data.consumptionIdleSeasonalBegin,
+        detail_data.consumptionIdleSeasonalEnd,
+        str(detail_data.mileageCalcMethod),
+        detail_data.mileageCoeff,
+        int(bool(detail_data.dottedLineTrackWhenNoCoords)),
+        detail_data.highlightSensorGuid,
+        str(detail_data.motohoursCalcMethod),
+        counters.mileage if counters else None,
+        counters.motohours if counters else None,
+        counters.mileageTime if counters else None,
+        counters.motohoursTime if counters else None,
+        retrieved_at,
+    )
+
+
+def _row_sensor(
+    vehicle_id: int, sensor: VehicleSensorSchema, retrieved_at: str
+) -> tuple:
+    """Строка таблицы vehicle_sensors_detail в порядке SENSOR_COLUMNS."""
+    sensor_type = sensor.type
+    # Один поиск в словаре; int - если вдруг API вернет числовой ID типа
+    sensor_type_id_fk = (
+        SENSOR_TYPE_NAME_TO_ID_MAP.get(sensor_type)
+        if isinstance(sensor_type, str)
+        else (sensor_type if isinstance(sensor_type, int) else None)
+    )
+
+    if sensor_type_id_fk is None and sensor_type is not None:
+        logger.warning(
+            f"Не удалось найти ID для типа сенсора '{sensor_type}' в справочнике sensor_types для vehicleId {vehicle_id}, sensor_id {sensor.id}. sensor_type_id будет NULL."
+        )
+
+    return (
+        vehicle_id,
+        sensor.id,
+        sensor.name,
+        str(sensor_type) if sensor_type is not None else None,
+        sensor_type_id_fk,
+        str(sensor.inputType),
+        sensor.inputNumber,
+        sensor.pseudonym,
+        int(bool(sensor.isInverted)),
+        int(bool(sensor.disabled)),
+        int(bool(sensor.showInTooltip)),
+        int(bool(sensor.showLastValid)),
+        str(sensor.gradeType),
+        (
+            to_json_text(sensor.gradesTables)
+            if sensor.gradesTables
+            else None
+        ),
+        sensor.kind,
+        sensor.color,
+        int(bool(sensor.showAsDutOnGraph)),
+        int(bool(sensor.showWithoutIgn)),
+        sensor.agrFunction,
+        sensor.expr,
+        (
+            to_json_text(sensor.customParams)
+            if sensor.customParams
+            else None
         ),
-        "highlightSensorGuid": detail_data.highlightSensorGuid,
-        "motohoursCalcMethod": str(detail_data.motohoursCalcMethod),
-    }
-    if detail_data.counters:
-        main_data["counter_mileage"] = detail_data.counters.mileage
-        main_data["counter_motohours"] = detail_data.counters.motohours
-        main_data["counter_mileageTime"] = detail_data.counters.mileageTime
-        main_data["counter_motohoursTime"] = detail_data.counters.motohoursTime
-    insert_data(conn, "vehicle_details", main_data)
-
-    if detail_data.customFields:
-        for cf in detail_data.customFields:
-            cf_data = {
-                "vehicleId": detail_data.vehicleId,
-                "custom_field_id": cf.id,
-                "name": cf.name,
-                "value_text": (
-                    json.dumps(cf.value, ensure_ascii=False)
-                    if cf.value is not None
-                    else None
-                ),
-                "forTooltip": 1 if cf.forTooltip else 0,
-            }
-            insert_data(conn, "vehicle_custom_fields_detail", cf_data)
-
-    if detail_data.sensors:
-        for sensor in detail_data.sensors:
-            sensor_type_id_fk = None
-            if (
-                isinstance(sensor.type, str)
-                and sensor.type in SENSOR_TYPE_NAME_TO_ID_MAP
-            ):
-                sensor_type_id_fk = SENSOR_TYPE_NAME_TO_ID_MAP[sensor.type]
-            elif isinstance(sensor.type, int):  # Если вдруг API вернет числовой ID типа
-                sensor_type_id_fk = sensor.type
+        (
+            str(sensor.summaryMaxValue)
+            if sensor.summaryMaxValue is not None
+            else None
+        ),
+        (
+            to_json_text(sensor.valueIntervals)
+            if sensor.valueIntervals
+            else None
+        ),
+        int(bool(sensor.disableEmissionsValidation)),
+        sensor.unitOfMeasure,
+        sensor.medianDegree,
+        retrieved_at,
+    )
 
-            if sensor_type_id_fk is None and sensor.type is not None:
-                logger.warning(
-                    f"Не удалось найти ID для типа сенсора '{sensor.type}' в справочнике sensor_types для vehicleId {detail_data.vehicleId}, sensor_id {sensor.id}. sensor_type_id будет NULL."
+
+# Подготовленные один раз при загрузке модуля запросы вставки:
+# таблица -> (SQL, колонки в порядке значений строки)
+TABLE_SQL: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    table_name: (
+        build_insert_sql(table_name, list(columns), DB_TYPE == "sqlite"),
+        columns,
+    )
+    for table_name, columns in {
+        **REPORT_TABLE_COLUMNS,
+        "device_types": DEVICE_TYPE_COLUMNS,
+        "sensor_types": SENSOR_TYPE_COLUMNS,
+        "drivers": DRIVER_COLUMNS,
+        "last_data": LAST_DATA_COLUMNS,
+        "vehicle_details": VEHICLE_DETAIL_COLUMNS,
+        "vehicle_cmsv6_params": CMSV6_COLUMNS,
+        "vehicle_custom_fields_detail": CUSTOM_FIELD_COLUMNS,
+        "vehicle_sensors_detail": SENSOR_COLUMNS,
+        "vehicle_drivers_assigned": ASSIGNED_DRIVER_COLUMNS,
+        "vehicle_status_history_items": STATUS_HISTORY_COLUMNS,
+        "vehicle_command_templates": COMMAND_TEMPLATE_COLUMNS,
+        "vehicle_inspection_tasks": INSPECTION_TASK_COLUMNS,
+    }.items()
+}
+
+
+def defer_unique_indexes():
+    """
+    Включает режим массовой загрузки: таблицы создаются без UNIQUE, строки
+    вставляются простым INSERT, а уникальные индексы строятся в конце
+    (create_deferred_unique_indexes). Вызывается до create_tables.
+    """
+    DEFERRED_UNIQUE_TABLES.update(DEFERRABLE_UNIQUE_TABLES)
+    for table_name in DEFERRED_UNIQUE_TABLES:
+        columns = TABLE_SQL[table_name][1]
+        TABLE_SQL[table_name] = (
+            build_insert_sql(table_name, list(columns), DB_TYPE == "sqlite"),
+            columns,
+        )
+
+
+def create_deferred_unique_indexes(conn: DBConnection):
+    """
+    Строит отложенные уникальные индексы после массовой загрузки.
+    Повторы по уникальным колонкам, которые при UPSERT были бы обновлены
+    на месте, сначала удаляются: остается последняя вставленная строка.
+    Строки с NULL в уникальных колонках, как и для UNIQUE, повторами не считаются.
+    """
+    if not conn or not DEFERRED_UNIQUE_TABLES:
+        return
+    is_sqlite = isinstance(conn, sqlite3.Connection)
+    try:
+        with db_transaction(conn):
+            for table_name in sorted(DEFERRED_UNIQUE_TABLES):
+                quoted_table_name = quote_identifier(table_name)
+                unique_cols = [
+                    quote_identifier(col) for col in TABLE_UNIQUE_COLUMNS[table_name]
+                ]
+                not_null = " AND ".join(f"{col} IS NOT NULL" for col in unique_cols)
+                statements = (
+                    f"DELETE FROM {quoted_table_name} WHERE {not_null} AND id NOT IN "
+                    f"(SELECT MAX(id) FROM {quoted_table_name} GROUP BY {', '.join(unique_cols)})",
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {quote_identifier('ux_' + table_name)} "
+                    f"ON {quoted_table_name} ({', '.join(unique_cols)})",
                 )
+                for sql in statements:
+                    conn.execute(sql if is_sqlite else text(sql))
+        logger.info(
+            f"Построены уникальные индексы для {len(DEFERRED_UNIQUE_TABLES)} таблиц."
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при построении уникальных индексов: {e}")
+        return
+    # Дальнейшие вставки снова выполняются через UPSERT
+    DEFERRED_UNIQUE_TABLES.clear()
+    for table_name, (_, columns) in list(TABLE_SQL.items()):
+        TABLE_SQL[table_name] = (
+            build_insert_sql(table_name, list(columns), DB_TYPE == "sqlite"),
+            columns,
+        )
 
-            sensor_data = {
-                "vehicleId": detail_data.vehicleId,
-                "sensor_id": sensor.id,
-                "name": sensor.name,
-                "type_str": str(sensor.type) if sensor.type is not None else None,
-                "sensor_type_id": sensor_type_id_fk,
-                "inputType": str(sensor.inputType),
-                "inputNumber": sensor.inputNumber,
-                "pseudonym": sensor.pseudonym,
-                "isInverted": 1 if sensor.isInverted else 0,
-                "disabled": 1 if sensor.disabled else 0,
-                "showInTooltip": 1 if sensor.showInTooltip else 0,
-                "showLastValid": 1 if sensor.showLastValid else 0,
-                "gradeType": str(sensor.gradeType),
-                "gradesTables_json": (
-                    json.dumps(
-                        [gt.model_dump() for gt in sensor.gradesTables],
-                        ensure_ascii=False,
-                    )
-                    if sensor.gradesTables
-                    else None
-                ),
-                "kind": sensor.kind,
-                "color": sensor.color,
-                "showAsDutOnGraph": 1 if sensor.showAsDutOnGraph else 0,
-                "showWithoutIgn": 1 if sensor.showWithoutIgn else 0,
-                "agrFunction": sensor.agrFunction,
-                "expr": sensor.expr,
-                "customParams_json": (
-                    json.dumps(sensor.customParams, ensure_ascii=False)
-                    if sensor.customParams
-                    else None
-                ),
-                "summaryMaxValue_text": (
-                    str(sensor.summaryMaxValue)
-                    if sensor.summaryMaxValue is not None
-                    else None
-                ),
-                "valueIntervals_json": (
-                    json.dumps(sensor.valueIntervals, ensure_ascii=False)
-                    if sensor.valueIntervals
-                    else None
-                ),
-                "disableEmissionsValidation": (
-                    1 if sensor.disableEmissionsValidation else 0
-                ),
-                "unitOfMeasure": sensor.unitOfMeasure,
-                "medianDegree": sensor.medianDegree,
-            }
-            insert_data(conn, "vehicle_sensors_detail", sensor_data)
-
-    if detail_data.drivers:
-        for driver_assigned in detail_data.drivers:
-            driver_data = {
-                "vehicleId": detail_data.vehicleId,
-                "driver_id": driver_assigned.id,
-                "name": driver_assigned.name,
-                "isDefault": 1 if driver_assigned.isDefault else 0,
-            }
-            insert_data(conn, "vehicle_drivers_assigned", driver_data)
-    if detail_data.statusHistory:
-        for history_item in detail_data.statusHistory:
-            history_data = {
-                "vehicleId": detail_data.vehicleId,
-                "status": history_item.status,
-                "date": history_item.date,
-                "description": history_item.description,
-                "additionalInfo": history_item.additionalInfo,
-            }
-            insert_data(conn, "vehicle_status_history_items", history_data)
-    if detail_data.cmsv6Parameters:
-        cms_data = detail_data.cmsv6Parameters.model_dump(exclude_none=True)
-        cms_data["vehicleId"] = detail_data.vehicleId
-        cms_data["cms_id"] = cms_data.pop("id", None)
-        cms_data["enabled"] = 1 if cms_data.get("enabled") else 0
-        insert_data(conn, "vehicle_cmsv6_params", cms_data)
-    if detail_data.commandTemplates:
-        for template in detail_data.commandTemplates:
-            tpl_data = template.model_dump(exclude_none=True)
-            tpl_data["vehicleId"] = detail_data.vehicleId
-            tpl_data["command_template_id"] = tpl_data.pop("id")
-            insert_data(conn, "vehicle_command_templates", tpl_data)
-    if detail_data.inspectionTasks:
-        for task in detail_data.inspectionTasks:
-            task_data = task.model_dump(exclude_none=True)
-            task_data["vehicleId"] = detail_data.vehicleId
-            task_data["task_id"] = task_data.pop("id")
-            task_data["enabled"] = 1 if task_data.get("enabled") else 0
-            insert_data(conn, "vehicle_inspection_tasks", task_data)
 
+def save_vehicle_detail_data(
+    conn: DBConnection, detail_data: VehicleDetailResponseSchema, retrieved_at: str
+):
+    """
+    Сохраняет детальную информацию о ТС и связанные с ней данные в точке
+    сохранения текущей транзакции: ошибка откатывает только данные этого ТС.
+    Фиксацию транзакции выполняет вызывающий код (пакетами по нескольку ТС).
+    """
+    if not conn or not detail_data:
+        return
+    try:
+        with db_savepoint(conn, "vehicle_detail"):
+            _insert_vehicle_detail_rows(conn, detail_data, retrieved_at)
+    except Exception as e:
+        logger.error(
+            f"Детальная информация ТС ID {detail_data.vehicleId} не сохранена, изменения ТС отменены: {e}"
+        )
 
-# --- Основное выполнение ---
-if __name__ == "__main__":
-    # Удаление старого файла БД только для SQLite
-    if DB_TYPE == "sqlite" and os.path.exists(SQLITE_DB_FILE):
-        try:
-            os.remove(SQLITE_DB_FILE)
-            logger.info(f"Старый файл SQLite БД {SQLITE_DB_FILE} удален.")
-        except OSError as e:
-            logger.error(
-                f"Не удалось удалить старый файл SQLite БД {SQLITE_DB_FILE}: {e}"
-            )
 
-    db_conn = get_db_connection()
-    if db_conn:
-        try:
-            create_tables(db_conn)
-        except Exception as e_create:
-            logger.error(
-                f"Критическая ошибка при создании таблиц: {e_create}. Выполнение прервано."
-            )
-            if DB_TYPE == "postgres":
-                db_conn.close()
-            elif DB_TYPE == "sqlite":
-                db_conn.close()
-            exit(1)
-    else:
-        logger.error("Не удалось подключиться к БД. Завершение работы.")
-        exit(1)
+def _insert_vehicle_detail_rows(
+    conn: DBConnection, detail_data: VehicleDetailResponseSchema, retrieved_at: str
+):
+    """
+    Вставляет строки детальной информации ТС в текущую транзакцию.
+    Строки собираются кортежами прямо из атрибутов моделей, без model_dump().
+    """
+    vehicle_id = detail_data.vehicleId
+    cmsv6 = detail_data.cmsv6Parameters
+    child_rows = (
+        ("vehicle_details", [_row_vehicle_detail(detail_data, retrieved_at)]),
+        (
+            "vehicle_cmsv6_params",
+            [
+                (
+                    vehicle_id,
+                    cmsv6.id,
+                    int(bool(cmsv6.enabled)),
+                    cmsv6.host,
+                    cmsv6.login,
+                    cmsv6.password,
+                    retrieved_at,
+                )
+            ]
+            if cmsv6
+            else [],
+        ),
+        (
+            "vehicle_custom_fields_detail",
+            [
+                (
+                    vehicle_id,
+                    cf.id,
+                    cf.name,
+                    (
+                        to_json_text(cf.value)
+                        if cf.value is not None
+                        else None
+                    ),
+                    int(bool(cf.forTooltip)),
+                    retrieved_at,
+                )
+                for cf in detail_data.customFields or ()
+            ],
+        ),
+        (
+            "vehicle_sensors_detail",
+            [
+                _row_sensor(vehicle_id, sensor, retrieved_at)
+                for sensor in detail_data.sensors or ()
+            ],
+        ),
+        (
+            "vehicle_drivers_assigned",
+            [
+                (
+                    vehicle_id,
+                    driver_assigned.id,
+                    driver_assigned.name,
+                    int(bool(driver_assigned.isDefault)),
+                    retrieved_at,
+                )
+                for driver_assigned in detail_data.drivers or ()
+            ],
+        ),
+        (
+            "vehicle_status_history_items",
+            [
+                (
+                    vehicle_id,
+                    history_item.status,
+                    history_item.date,
+                    history_item.description,
+                    history_item.additionalInfo,
+                    retrieved_at,
+                )
+                for history_item in detail_data.statusHistory or ()
+            ],
+        ),
+        (
+            "vehicle_command_templates",
+            [
+                (
+                    vehicle_id,
+                    template.id,
+                    template.name,
+                    template.command,
+                    template.retries,
+                    retrieved_at,
+                )
+                for template in detail_data.commandTemplates or ()
+            ],
+        ),
+        (
+            "vehicle_inspection_tasks",
+            [
+                (
+                    vehicle_id,
+                    task.id,
+                    int(bool(task.enabled)),
+                    task.name,
+                    task.description,
+                    task.mileageCondition,
+                    task.lastMileage,
+                    task.motohoursCondition,
+                    task.lastMotohours,
+                    task.periodicCondition,
+                    task.kind,
+                    task.lastInspectionDate,
+                    task.maxQuantity,
+                    retrieved_at,
+                )
+                for task in detail_data.inspectionTasks or ()
+            ],
+        ),
+    )
+    # Один курсор SQLite на все пакеты ТС
+    cursor = conn.cursor() if isinstance(conn, sqlite3.Connection) else None
+    try:
+        for table_name, rows in child_rows:
+            insert_rows(conn, table_name, rows, commit=False, cursor=cursor)
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+
+def get_saved_vehicle_ids(conn: DBConnection) -> set:
+    """Возвращает ID ТС, для которых в vehicle_details есть строка."""
+    sql = f"SELECT {quote_identifier('vehicleId')} FROM {quote_identifier('vehicle_details')}"
+    rows = conn.execute(sql if isinstance(conn, sqlite3.Connection) else text(sql))
+    return {row[0] for row in rows}
+
+
+def keep_saved_vehicle_rows(
+    table_name: str,
+    rows: List[tuple],
+    saved_vehicle_ids: Optional[set],
+    description: str,
+) -> List[tuple]:
+    """
+    Отбрасывает строки ТС без записи в vehicle_details (например, детали не
+    получены на этапе 2): иначе внешний ключ отменил бы вставку всего пакета.
+    """
+    if saved_vehicle_ids is None:
+        return rows
+    vehicle_id_index = TABLE_SQL[table_name][1].index("vehicleId")
+    kept_rows = [
+        row
+        for row in rows
+        if row[vehicle_id_index] is None or row[vehicle_id_index] in saved_vehicle_ids
+    ]
+    if len(kept_rows) != len(rows):
+        logger.warning(
+            f"{description}: пропущено {len(rows) - len(kept_rows)} строк {table_name} для ТС без детальной информации."
+        )
+    return kept_rows
 
-    if not API_LOGIN or not API_PASSWORD:
+
+def save_call_response(
+    conn: Optional[DBConnection],
+    call_template: dict,
+    description: str,
+    validated_response: Any,
+    retrieved_at: str,
+    saved_vehicle_ids: Optional[set] = None,
+):
+    """
+    Сохраняет в БД ответ одного запроса этапа 3 (отчеты, последние данные, водители).
+    Если задан saved_vehicle_ids, строки отчетов и последних данных
+    сохраняются только для этих ТС.
+    """
+    if validated_response is not None and conn:
+        report_handler = REPORT_ROW_HANDLERS.get(call_template["path"])
+        db_table_name = call_template.get("db_table")
+        if report_handler:
+            response_list_to_process = (
+                validated_response
+                if isinstance(validated_response, list)
+                else [validated_response]
+            )
+            report_rows: Dict[str, List[tuple]] = defaultdict(list)
+            report_handler(response_list_to_process, retrieved_at, report_rows)
+            for table_name, rows in report_rows.items():
+                insert_rows(
+                    conn,
+                    table_name,
+                    keep_saved_vehicle_rows(
+                        table_name, rows, saved_vehicle_ids, description
+                    ),
+                )
+        elif db_table_name:
+            response_list_to_process = (
+                validated_response
+                if isinstance(validated_response, list)
+                else [validated_response]
+            )
+            # Строки копятся кортежами и вставляются одним пакетом на ответ
+            table_rows: List[tuple] = []
+            try:
+                with db_transaction(conn):
+                    for item_from_response in response_list_to_process:
+                        if not isinstance(item_from_response, PydanticBaseModel):
+                            logger.warning(
+                                f"Элемент для {db_table_name} не Pydantic ({type(item_from_response)}), пропуск: {str(item_from_response)[:100]}"
+                            )
+                            continue
+                        if db_table_name == "last_data" and isinstance(
+                            item_from_response, LastDataObjectSchema
+                        ):
+                            table_rows.append(
+                                _row_last_data(item_from_response, retrieved_at)
+                            )
+                        elif db_table_name == "drivers" and isinstance(
+                            item_from_response, DriverInfoSchema
+                        ):
+                            table_rows.append(
+                                _row_driver(item_from_response, retrieved_at)
+                            )
+                    if db_table_name == "last_data":
+                        table_rows = keep_saved_vehicle_rows(
+                            db_table_name, table_rows, saved_vehicle_ids, description
+                        )
+                    insert_rows(conn, db_table_name, table_rows, commit=False)
+            except Exception as e:
+                logger.error(
+                    f"Данные {description} не сохранены, транзакция отменена: {e}"
+                )
+        else:
+            logger.debug(
+                f"Для {description} не указана таблица БД, данные не сохраняются."
+            )
+    elif validated_response is None and conn:
+        logger.warning(
+            f"Не удалось получить или валидировать ответ для {description}. Данные не сохраняются."
+        )
+    elif not conn:
         logger.error(
-            "API_LOGIN и API_PASSWORD должны быть установлены в .env.")
-        if DB_TYPE == "postgres":
-            db_conn.close()
-        elif DB_TYPE == "sqlite":
-            db_conn.close()
-        exit(1)
+            f"Нет соединения с БД, данные для {description} не могут быть сохранены."
+        )
 
-    auth_token = authenticate()
-    if auth_token:
-        logger.info(
-            f"Ожидание {REQUEST_DELAY_SECONDS}с после аутентификации...")
-        time.sleep(REQUEST_DELAY_SECONDS)
-    else:
-        logger.error("Невозможно продолжить без токена.")
-        if DB_TYPE == "postgres":
-            db_conn.close()
-        elif DB_TYPE == "sqlite":
-            db_conn.close()
-        exit(1)
+
+# --- Основное выполнение ---
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(
+        description="Загрузка данных GlonassSoft API в базу данных."
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Очистить дисковый кэш ответов API и загрузить все заново",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Массовая загрузка в новую БД SQLite: уникальные индексы таблиц "
+        "строятся после вставки всех данных",
+    )
+    return parser.parse_args(argv)
+
+
+def load_data(db_conn: DBConnection, auth_token: str):
+    """Этапы загрузки: справочники, детали ТС, отчеты и данные по списку ТС."""
+    # Единая метка времени retrieved_at для всех строк этого цикла загрузки
+    cycle_retrieved_at = datetime.now(timezone.utc).isoformat()
 
     logger.info("--- Этап 1: Загрузка справочников ---")
     device_types_resp = make_api_request(
         "GET", "/devices/types", token=auth_token, response_list_model=DeviceTypeSchema
     )
     if device_types_resp and isinstance(device_types_resp, list) and db_conn:
-        for dt in device_types_resp:
-            if isinstance(dt, DeviceTypeSchema):
-                insert_data(
+        try:
+            with db_transaction(db_conn):
+                insert_rows(
                     db_conn,
                     "device_types",
-                    dt.model_dump(
-                        exclude_none=True))
-        logger.info(f"Загружено {len(device_types_resp)} типов устройств.")
+                    [
+                        (dt.deviceTypeId, dt.deviceTypeName, cycle_retrieved_at)
+                        for dt in device_types_resp
+                        if isinstance(dt, DeviceTypeSchema)
+                    ],
+                    commit=False,
+                )
+            logger.info(f"Загружено {len(device_types_resp)} типов устройств.")
+        except Exception as e:
+            logger.error(f"Типы устройств не сохранены: {e}")
     else:
         logger.warning("Не удалось загрузить типы устройств.")
-    time.sleep(REQUEST_DELAY_SECONDS)
 
     sensor_types_resp = make_api_request(
         "GET", "/sensors/types", token=auth_token, response_list_model=SensorTypeSchema
@@ -876,31 +2131,42 @@ if __name__ == "__main__":
     if sensor_types_resp and isinstance(sensor_types_resp, list) and db_conn:
         SENSOR_TYPE_NAME_TO_ID_MAP.clear()
         for st_item in sensor_types_resp:
-            if isinstance(st_item, SensorTypeSchema):
-                insert_data(
-                    db_conn, "sensor_types", st_item.model_dump(
-                        exclude_none=True)
+            if (
+                isinstance(st_item, SensorTypeSchema)
+                and st_item.name
+                and st_item.id is not None
+            ):
+                # Интернированные ключи: совпадающие строки сравниваются по ссылке
+                SENSOR_TYPE_NAME_TO_ID_MAP[sys.intern(st_item.name)] = st_item.id
+        try:
+            with db_transaction(db_conn):
+                insert_rows(
+                    db_conn,
+                    "sensor_types",
+                    [
+                        (
+                            st_item.id,
+                            st_item.name,
+                            st_item.description,
+                            cycle_retrieved_at,
+                        )
+                        for st_item in sensor_types_resp
+                        if isinstance(st_item, SensorTypeSchema)
+                    ],
+                    commit=False,
                 )
-                if st_item.name and st_item.id is not None:
-                    SENSOR_TYPE_NAME_TO_ID_MAP[st_item.name] = st_item.id
-        logger.info(
-            f"Загружено {len(sensor_types_resp)} типов датчиков. Карта имен создана."
-        )
+            logger.info(
+                f"Загружено {len(sensor_types_resp)} типов датчиков. Карта имен создана."
+            )
+        except Exception as e:
+            logger.error(f"Типы датчиков не сохранены: {e}")
     else:
         logger.warning("Не удалось загрузить типы датчиков.")
-    time.sleep(REQUEST_DELAY_SECONDS)
     logger.info("--- Этап 1: Загрузка справочников завершена ---")
 
-    all_vehicles_data_list: List[VehicleListItemSchema] = get_all_vehicles_with_data(
+    active_vehicle_ids, all_parent_ids_from_vehicles = get_all_vehicle_ids(
         token=auth_token
     )
-    active_vehicle_ids: List[int] = [
-        v.vehicleId for v in all_vehicles_data_list if v.vehicleId is not None
-    ]
-    all_parent_ids_from_vehicles = set()
-    for v_data in all_vehicles_data_list:
-        if v_data.parentId:
-            all_parent_ids_from_vehicles.add(v_data.parentId)
 
     if not active_vehicle_ids:
         logger.warning(
@@ -910,35 +2176,51 @@ if __name__ == "__main__":
         logger.info(
             f"--- Этап 2: Обработка детальной информации для {len(active_vehicle_ids)} ТС ---"
         )
-        for i, v_id in enumerate(active_vehicle_ids):
-            logger.info(
-                f"Запрос деталей для ТС ID: {v_id} ({i+1}/{len(active_vehicle_ids)})"
+        # Запросы деталей выполняются в пуле потоков (частоту ограничивает
+        # API_RATE_LIMITER), а запись в БД - только из основного потока,
+        # с фиксацией транзакции раз в DETAIL_COMMIT_EVERY_VEHICLES ТС
+        detail_requests = (
+            (
+                v_id,
+                {
+                    "method": "GET",
+                    "endpoint_path": f"/vehicles/{v_id}",
+                    "token": auth_token,
+                    "response_model": VehicleDetailResponseSchema,
+                    "request_interval": DETAIL_REQUEST_DELAY_SECONDS,
+                },
             )
-            detail_response = make_api_request(
-                method="GET",
-                endpoint_path=f"/vehicles/{v_id}",
-                token=auth_token,
-                response_model=VehicleDetailResponseSchema,
+            for v_id in active_vehicle_ids
+        )
+        saved_details_count = 0
+        for i, (v_id, detail_response) in enumerate(iter_api_responses(detail_requests)):
+            logger.info(
+                f"Получены детали для ТС ID: {v_id} ({i+1}/{len(active_vehicle_ids)})"
             )
             if detail_response and isinstance(
                 detail_response, VehicleDetailResponseSchema
             ):
-                save_vehicle_detail_data(db_conn, detail_response)
+                begin_transaction(db_conn)
+                save_vehicle_detail_data(db_conn, detail_response, cycle_retrieved_at)
+                saved_details_count += 1
+                if saved_details_count % DETAIL_COMMIT_EVERY_VEHICLES == 0:
+                    db_conn.commit()
                 if detail_response.parentId:
                     all_parent_ids_from_vehicles.add(detail_response.parentId)
             else:
                 logger.warning(
                     f"Не удалось получить или валидировать детальную информацию для ТС ID: {v_id}"
                 )
-            logger.info(
-                f"Ожидание {DETAIL_REQUEST_DELAY_SECONDS}с после деталей ТС ID: {v_id}..."
-            )
-            time.sleep(DETAIL_REQUEST_DELAY_SECONDS)
+        db_conn.commit()
         logger.info(
             f"--- Этап 2: Завершена обработка деталей. Уникальных parentId: {len(all_parent_ids_from_vehicles)} ---"
         )
 
-    now_utc = datetime.now(timezone.utc)
+    # Строки отчетов по ТС без vehicle_details нарушили бы внешний ключ
+    saved_vehicle_ids = get_saved_vehicle_ids(db_conn) if db_conn else None
+
+    # API достаточно секундной точности: без микросекунд строка короче
+    now_utc = datetime.now(timezone.utc).replace(microsecond=0)
     to_time_utc_dt = now_utc
     from_time_utc_dt = now_utc - timedelta(days=DAYS_FOR_REPORTS)
     to_time_iso_str = to_time_utc_dt.isoformat().replace("+00:00", "Z")
@@ -946,6 +2228,12 @@ if __name__ == "__main__":
     logger.info(
         f"Период для отчетов: с {from_time_iso_str} по {to_time_iso_str}")
     sampling_daily_seconds = 24 * 60 * 60
+    # Период одинаков для всех отчетов: фрагмент тела запроса строится один раз
+    report_period = {
+        "from": from_time_iso_str,
+        "to": to_time_iso_str,
+        "timezone": 0,
+    }
 
     api_calls_templates = [
         {
@@ -954,14 +2242,11 @@ if __name__ == "__main__":
             "json_data_template": {
                 "sampling": sampling_daily_seconds,
                 "vehicleIds": [],
-                "from": from_time_iso_str,
-                "to": to_time_iso_str,
-                "timezone": 0,
+                **report_period,
             },
             "params": None,
             "description": f"Пробег и моточасы ({DAYS_FOR_REPORTS}д)",
             "response_list_model": VehicleMileageMotohoursDataSchema,
-            "db_table": "mileage_motohours",
             "requires_vehicle_ids": True,
         },
         {
@@ -970,40 +2255,26 @@ if __name__ == "__main__":
             "json_data_template": {
                 "sampling": sampling_daily_seconds,
                 "vehicleIds": [],
-                "from": from_time_iso_str,
-                "to": to_time_iso_str,
-                "timezone": 0,
+                **report_period,
             },
             "params": None,
             "description": f"Расход топлива ({DAYS_FOR_REPORTS}д)",
             "response_list_model": VehicleFuelConsumptionDataSchema,
-            "db_table": "fuel_consumption",
             "requires_vehicle_ids": True,
         },
         {
             "method": "POST",
             "path": "/vehicles/fuelInOut",
-            "json_data_template": {
-                "vehicleIds": [],
-                "from": from_time_iso_str,
-                "to": to_time_iso_str,
-                "timezone": 0,
-            },
+            "json_data_template": {"vehicleIds": [], **report_period},
             "params": None,
             "description": f"Заправки и сливы ({DAYS_FOR_REPORTS}д)",
             "response_list_model": VehicleFuelInOutDataSchema,
-            "db_table": "fuel_events",
             "requires_vehicle_ids": True,
         },
         {
             "method": "POST",
             "path": "/vehicles/moveStop",
-            "json_data_template": {
-                "vehicleIds": [],
-                "from": from_time_iso_str,
-                "to": to_time_iso_str,
-                "timezone": 0,
-            },
+            "json_data_template": {"vehicleIds": [], **report_period},
             "params": None,
             "description": f"Движение и стоянки ({DAYS_FOR_REPORTS}д)",
             "response_list_model": VehicleMoveStopDataSchema,
@@ -1043,31 +2314,24 @@ if __name__ == "__main__":
     logger.info(
         f"--- Этап 3: Загрузка отчетов и данных по списку ТС ({len(api_calls_templates)} задач) ---"
     )
+    prepared_calls: List[Tuple[dict, str, Optional[Union[dict, list]]]] = []
+    # Один список ID на все запросы; шаблоны копируются неглубоко и не изменяются
+    vehicle_ids_list = active_vehicle_ids.tolist()
     for call_template in api_calls_templates:
         description = call_template.get(
             "description", f"{call_template['method']} {call_template['path']}"
         )
-        logger.info(f"--- Обработка: {description} ---")
         actual_json_data: Optional[Union[dict, list]] = None
         template_data = call_template.get("json_data_template")
         if call_template.get("requires_vehicle_ids"):
             if not active_vehicle_ids:
                 logger.warning(f"Пропуск {call_template['path']}, нет ID ТС.")
-                time.sleep(REQUEST_DELAY_SECONDS)
                 continue
             if template_data is not None:
-                actual_json_data = (
-                    copy.deepcopy(template_data)
-                    if isinstance(template_data, dict)
-                    else list(template_data)
-                )
                 if call_template.get("is_body_list_of_ids"):
-                    actual_json_data = active_vehicle_ids
-                elif (
-                    isinstance(actual_json_data, dict)
-                    and "vehicleIds" in actual_json_data
-                ):
-                    actual_json_data["vehicleIds"] = active_vehicle_ids
+                    actual_json_data = vehicle_ids_list
+                elif isinstance(template_data, dict) and "vehicleIds" in template_data:
+                    actual_json_data = {**template_data, "vehicleIds": vehicle_ids_list}
                 else:
                     logger.error(
                         f"Шаблон для {call_template['path']} некорректен. Пропуск."
@@ -1079,160 +2343,122 @@ if __name__ == "__main__":
                 )
                 continue
         elif template_data is not None:
-            actual_json_data = (
-                copy.deepcopy(template_data)
-                if isinstance(template_data, dict)
-                else list(template_data)
-            )
-        validated_response = make_api_request(
-            call_template["method"],
-            call_template["path"],
-            token=auth_token,
-            json_data=actual_json_data,
-            params=call_template.get("params"),
-            response_model=call_template.get("response_model"),
-            response_list_model=call_template.get("response_list_model"),
+            actual_json_data = template_data
+        prepared_calls.append((call_template, description, actual_json_data))
+
+    # Запросы выполняются в пуле потоков (частоту ограничивает API_RATE_LIMITER),
+    # а ответы сохраняются в БД из основного потока по мере готовности
+    report_requests = (
+        (
+            (call_template, description),
+            {
+                "method": call_template["method"],
+                "endpoint_path": call_template["path"],
+                "token": auth_token,
+                "json_data": actual_json_data,
+                "params": call_template.get("params"),
+                "response_model": call_template.get("response_model"),
+                "response_list_model": call_template.get("response_list_model"),
+            },
         )
-        if validated_response is not None and db_conn:
-            db_table_name = call_template.get("db_table")
-            if db_table_name:
-                response_list_to_process = (
-                    validated_response
-                    if isinstance(validated_response, list)
-                    else [validated_response]
-                )
-                for item_from_response in response_list_to_process:
-                    if not isinstance(item_from_response, PydanticBaseModel):
-                        logger.warning(
-                            f"Элемент для {db_table_name} не Pydantic ({type(item_from_response)}), пропуск: {str(item_from_response)[:100]}"
-                        )
-                        continue
-                    item_dict_for_db = item_from_response.model_dump(
-                        exclude_none=True, by_alias=True
-                    )
-                    if db_table_name == "mileage_motohours" and isinstance(
-                        item_from_response, VehicleMileageMotohoursDataSchema
-                    ):
-                        if item_from_response.periods:
-                            for period in item_from_response.periods:
-                                period_data = period.model_dump(
-                                    exclude_none=True)
-                                period_data["vehicleId"] = item_from_response.vehicleId
-                                period_data["period_start"] = period_data.pop(
-                                    "start", None
-                                )
-                                period_data["period_end"] = period_data.pop(
-                                    "end", None)
-                                insert_data(
-                                    db_conn, db_table_name, period_data)
-                    elif db_table_name == "fuel_consumption" and isinstance(
-                        item_from_response, VehicleFuelConsumptionDataSchema
-                    ):
-                        if item_from_response.periods:
-                            for period in item_from_response.periods:
-                                period_data = period.model_dump(
-                                    exclude_none=True)
-                                period_data["vehicleId"] = item_from_response.vehicleId
-                                period_data["period_start"] = period_data.pop(
-                                    "start", None
-                                )
-                                period_data["period_end"] = period_data.pop(
-                                    "end", None)
-                                insert_data(
-                                    db_conn, db_table_name, period_data)
-                    elif db_table_name == "fuel_events" and isinstance(
-                        item_from_response, VehicleFuelInOutDataSchema
-                    ):
-                        if item_from_response.fuels:
-                            for fuel_event_obj in item_from_response.fuels:
-                                event_data = fuel_event_obj.model_dump(
-                                    exclude_none=True
-                                )
-                                event_data["report_period_start"] = (
-                                    item_from_response.start
-                                )
-                                event_data["report_period_end"] = item_from_response.end
-                                event_data["vehicleId"] = item_from_response.vehicleId
-                                event_data["vehicleModel"] = item_from_response.model
-                                event_data["event_type"] = event_data.pop(
-                                    "event", None)
-                                event_data["event_startDate"] = event_data.pop(
-                                    "startDate", None
-                                )
-                                event_data["event_endDate"] = event_data.pop(
-                                    "endDate", None
-                                )
-                                insert_data(db_conn, db_table_name, event_data)
-                    elif call_template["path"] == "/vehicles/moveStop" and isinstance(
-                        item_from_response, VehicleMoveStopDataSchema
-                    ):
-                        if item_from_response.moves:
-                            for move in item_from_response.moves:
-                                move_data = move.model_dump(exclude_none=True)
-                                move_data["vehicleId"] = item_from_response.vehicleId
-                                move_data["event_start"] = move_data.pop(
-                                    "start", None)
-                                move_data["event_end"] = move_data.pop(
-                                    "end", None)
-                                insert_data(db_conn, "move_events", move_data)
-                        if item_from_response.stops:
-                            for stop in item_from_response.stops:
-                                stop_data = stop.model_dump(exclude_none=True)
-                                stop_data["vehicleId"] = item_from_response.vehicleId
-                                stop_data["event_start"] = stop_data.pop(
-                                    "start", None)
-                                stop_data["event_end"] = stop_data.pop(
-                                    "end", None)
-                                insert_data(db_conn, "stop_events", stop_data)
-                    elif db_table_name == "last_data" and isinstance(
-                        item_from_response, LastDataObjectSchema
-                    ):
-                        current_item_dict = item_from_response.model_dump(
-                            exclude_none=True
-                        )
-                        if item_from_response.geozones:
-                            current_item_dict["geozones"] = json.dumps(
-                                [gz.model_dump()
-                                 for gz in item_from_response.geozones],
-                                ensure_ascii=False,
-                            )
-                        else:
-                            current_item_dict["geozones"] = None
-                        insert_data(db_conn, db_table_name, current_item_dict)
-                    elif db_table_name == "drivers" and isinstance(
-                        item_from_response, DriverInfoSchema
-                    ):
-                        current_item_dict = item_from_response.model_dump(
-                            exclude_none=True
-                        )
-                        current_item_dict["exclusive"] = (
-                            1 if current_item_dict.get("exclusive") else 0
-                        )
-                        current_item_dict["deleted"] = (
-                            1 if current_item_dict.get("deleted") else 0
-                        )
-                        insert_data(db_conn, db_table_name, current_item_dict)
-            else:
-                logger.debug(
-                    f"Для {description} не указана таблица БД, данные не сохраняются."
-                )
-        elif validated_response is None and db_conn:
-            logger.warning(
-                f"Не удалось получить или валидировать ответ для {description}. Данные не сохраняются."
+        for call_template, description, actual_json_data in prepared_calls
+    )
+    for (call_template, description), response in iter_api_responses(report_requests):
+        logger.info(f"--- Обработка: {description} ---")
+        save_call_response(
+            db_conn,
+            call_template,
+            description,
+            response,
+            cycle_retrieved_at,
+            saved_vehicle_ids,
+        )
+
+    logger.info("Все API-вызовы из основного цикла обработаны.")
+
+
+def main():
+    """Полный цикл загрузки: справочники, детали ТС, отчеты."""
+    args = parse_args()
+    if args.refresh:
+        API_RESPONSE_CACHE.clear()
+        logger.info("Кэш ответов API очищен (--refresh).")
+
+    # Удаление старого файла БД только для SQLite
+    if DB_TYPE == "sqlite" and os.path.exists(SQLITE_DB_FILE):
+        try:
+            os.remove(SQLITE_DB_FILE)
+            # Файлы WAL от предыдущего запуска не должны попасть в новую БД
+            for wal_suffix in ("-wal", "-shm"):
+                if os.path.exists(SQLITE_DB_FILE + wal_suffix):
+                    os.remove(SQLITE_DB_FILE + wal_suffix)
+            logger.info(f"Старый файл SQLite БД {SQLITE_DB_FILE} удален.")
+        except OSError as e:
+            logger.error(
+                f"Не удалось удалить старый файл SQLite БД {SQLITE_DB_FILE}: {e}"
             )
-        elif not db_conn:
+
+    if args.bulk_load:
+        if DB_TYPE == "sqlite":
+            defer_unique_indexes()
+            logger.info("Режим массовой загрузки: уникальные индексы будут построены в конце.")
+        else:
+            # Таблицы PostgreSQL не пересоздаются, повторная загрузка идет через UPSERT
+            logger.warning("--bulk-load поддерживается только для SQLite, флаг пропущен.")
+
+    db_conn = get_db_connection()
+    if db_conn:
+        try:
+            create_tables(db_conn)
+        except Exception as e_create:
             logger.error(
-                f"Нет соединения с БД, данные для {description} не могут быть сохранены."
+                f"Критическая ошибка при создании таблиц: {e_create}. Выполнение прервано."
             )
-        logger.info(
-            f"Ожидание {REQUEST_DELAY_SECONDS}с после API вызова {description}..."
-        )
-        time.sleep(REQUEST_DELAY_SECONDS)
+            if DB_TYPE == "postgres":
+                db_conn.close()
+            elif DB_TYPE == "sqlite":
+                db_conn.close()
+            exit(1)
+    else:
+        logger.error("Не удалось подключиться к БД. Завершение работы.")
+        exit(1)
+
+    if not API_LOGIN or not API_PASSWORD:
+        logger.error(
+            "API_LOGIN и API_PASSWORD должны быть установлены в .env.")
+        if DB_TYPE == "postgres":
+            db_conn.close()
+        elif DB_TYPE == "sqlite":
+            db_conn.close()
+        exit(1)
+
+    auth_token = authenticate()
+    if not auth_token:
+        logger.error("Невозможно продолжить без токена.")
+        if DB_TYPE == "postgres":
+            db_conn.close()
+        elif DB_TYPE == "sqlite":
+            db_conn.close()
+        exit(1)
+
+    try:
+        load_data(db_conn, auth_token)
+    finally:
+        # Отложенные уникальные индексы строятся и при прерванной загрузке
+        if db_conn and DEFERRED_UNIQUE_TABLES:
+            create_deferred_unique_indexes(db_conn)
 
-    logger.info("Все API-вызовы из основного цикла обработаны.")
     if db_conn:
         try:
             db_conn.close()
             logger.info(f"Соединение с БД закрыто.")
         except Exception as e:
             logger.error(f"Ошибка при закрытии соединения с БД: {e}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        SESSION.close()
+        API_RESPONSE_CACHE.close()
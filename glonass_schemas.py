@@ -1,12 +1,43 @@
-from datetime import datetime
-from decimal import Decimal
-from typing import Optional, List, Dict, Union, Any
-from uuid import UUID
+from typing import Optional, List, Union, Any
 from pydantic import BaseModel, Field, ConfigDict
 
 
 class APIBaseModel(BaseModel):
-    model_config = ConfigDict(from_attributes=True, extra='ignore')
+    # Схемы валидаторов строятся при первом использовании модели, а не при импорте
+    # Поля с alias заполняются только по alias (как в ответах API): один поиск ключа
+    model_config = ConfigDict(extra='ignore', defer_build=True)
+
+
+class TimeRangeRequestSchema(APIBaseModel):
+    """
+    Общая модель для запросов отчетов по списку ТС за период.
+    :param vehicleIds: Список ID объектов
+    :param from_datetime: Начало периода (строка в формате ISO datetime)
+    :param to_datetime: Окончание периода (строка в формате ISO datetime)
+    :param timezone: Временная зона, по умолчанию UTC+3
+    """
+    vehicleIds: List[int] = Field(description="Список ID объектов")
+    from_datetime: str = Field(alias="from", description="Начало периода (строка в формате ISO datetime)")
+    to_datetime: str = Field(alias="to", description="Окончание периода (строка в формате ISO datetime)")
+    timezone: Optional[int] = Field(None, description="Временная зона, по умолчанию UTC+3")
+
+
+class SampledTimeRangeRequestSchema(TimeRangeRequestSchema):
+    """
+    Общая модель для запросов отчетов с детализацией по периодам.
+    :param sampling: Частота дискретизации в секундах, минимум 60 секунд
+    """
+    sampling: int = Field(ge=60, description="Частота дискретизации в секундах, минимум 60 секунд")
+
+
+class ReportPeriodSchema(APIBaseModel):
+    """
+    Общая модель для периода отчета.
+    :param start: Начало периода (строка в формате ISO datetime)
+    :param end: Окончание периода (строка в формате ISO datetime)
+    """
+    start: Optional[str] = Field(None, description="Начало периода")
+    end: Optional[str] = Field(None, description="Окончание периода")
 
 
 # --- POST /api/v3/auth/login ---
@@ -69,7 +100,7 @@ class SensorTypeSchema(APIBaseModel):
 # --- POST /api/v3/vehicles/mileageAndMotohours ---
 
 
-class MileageMotohoursRequestSchema(APIBaseModel):
+class MileageMotohoursRequestSchema(SampledTimeRangeRequestSchema):
     """
     Модель для запроса данных о пробеге и моточасах.
     :param sampling: Частота дискретизации в секундах, минимум 60 секунд
@@ -78,14 +109,9 @@ class MileageMotohoursRequestSchema(APIBaseModel):
     :param to_datetime: Окончание периода (строка в формате ISO datetime)
     :param timezone: Временная зона, по умолчанию UTC+3
     """
-    sampling: int = Field(description="Частота дискретизации в секундах, минимум 60 секунд")
-    vehicleIds: List[int] = Field(description="Список ID объектов")
-    from_datetime: str = Field(alias="from", description="Начало периода (строка в формате ISO datetime)")
-    to_datetime: str = Field(alias="to", description="Окончание периода (строка в формате ISO datetime)")
-    timezone: Optional[int] = Field(None, description="Временная зона, по умолчанию UTC+3")
 
 
-class MileageMotohoursPeriodSchema(APIBaseModel):
+class MileageMotohoursPeriodSchema(ReportPeriodSchema):
     """
     Модель для периода данных о пробеге и моточасах.
     :param start: Начало периода (строка в формате ISO datetime)
@@ -98,8 +124,6 @@ class MileageMotohoursPeriodSchema(APIBaseModel):
     :param motohoursEnd: Моточасы на конец периода, секунды
     :param idlingTime: Холостой ход за период, секунды
     """
-    start: Optional[str] = Field(None, description="Начало периода")
-    end: Optional[str] = Field(None, description="Окончание периода")
     mileage: Optional[float] = Field(None, description="Пробег за период, километры")
     mileageBegin: Optional[float] = Field(None, description="Пробег на начало периода, километры")
     mileageEnd: Optional[float] = Field(None, description="Пробег на конец периода, километры")
@@ -127,7 +151,7 @@ class VehicleMileageMotohoursDataSchema(APIBaseModel):
 # --- POST /api/v3/vehicles/fuelConsumption ---
 
 
-class FuelConsumptionRequestSchema(APIBaseModel):
+class FuelConsumptionRequestSchema(SampledTimeRangeRequestSchema):
     """
     Модель для запроса данных о расходе топлива.
     :param sampling: Частота дискретизации в секундах, минимум 60 секунд
@@ -136,14 +160,9 @@ class FuelConsumptionRequestSchema(APIBaseModel):
     :param to_datetime: Окончание периода (строка в формате ISO datetime)
     :param timezone: Временная зона, по умолчанию UTC+3
     """
-    sampling: int = Field(description="Частота дискретизации в секундах, минимум 60 секунд")
-    vehicleIds: List[int] = Field(description="Список ID объектов")
-    from_datetime: str = Field(alias="from", description="Начало периода (строка в формате ISO datetime)")
-    to_datetime: str = Field(alias="to", description="Окончание периода (строка в формате ISO datetime)")
-    timezone: Optional[int] = Field(None, description="Временная зона, по умолчанию UTC+3")
 
 
-class FuelConsumptionPeriodSchema(APIBaseModel):
+class FuelConsumptionPeriodSchema(ReportPeriodSchema):
     """
     Модель для периода данных о расходе топлива.
     :param start: Начало периода (строка в формате ISO datetime)
@@ -156,8 +175,6 @@ class FuelConsumptionPeriodSchema(APIBaseModel):
     :param fuelConsumptionMove: Расход топлива в движении
     :param fuelConsumptionFactTank: Фактический расход топлива в цистерне
     """
-    start: Optional[str] = Field(None, description="Начало периода")
-    end: Optional[str] = Field(None, description="Окончание периода")
     fuelLevelStart: Optional[float] = Field(None, description="Уровень топлива на начало периода")
     fuelLevelEnd: Optional[float] = Field(None, description="Уровень топлива на конец периода")
     fuelTankLevelStart: Optional[float] = Field(None, description="Уровень топлива в цистерне на начало периода")
@@ -185,7 +202,7 @@ class VehicleFuelConsumptionDataSchema(APIBaseModel):
 # --- POST /api/v3/vehicles/fuelInOut ---
 
 
-class FuelInOutRequestSchema(APIBaseModel):
+class FuelInOutRequestSchema(TimeRangeRequestSchema):
     """
     Модель для запроса данных о заправках и сливах.
     :param vehicleIds: Список ID объектов
@@ -193,10 +210,6 @@ class FuelInOutRequestSchema(APIBaseModel):
     :param to_datetime: Дата и время окончания запроса (строка в формате ISO datetime)
     :param timezone: Временная зона, по умолчанию UTC+3
     """
-    vehicleIds: List[int] = Field(description="Список ID объектов")
-    from_datetime: str = Field(alias="from", description="Дата и время начала запроса (строка в формате ISO datetime)")
-    to_datetime: str = Field(alias="to", description="Дата и время окончания запроса (строка в формате ISO datetime)")
-    timezone: Optional[int] = Field(None, description="Временная зона, по умолчанию UTC+3")
 
 
 class FuelEventSchema(APIBaseModel):
@@ -209,7 +222,7 @@ class FuelEventSchema(APIBaseModel):
     :param fuelStart: Уровень топлива на начало события
     :param fuelEnd: Уровень топлива на конец события
     """
-    event: Optional[Union[int, str]] = Field(None, description="Тип события (числовое или строковое представление)")
+    event: Optional[str] = Field(None, coerce_numbers_to_str=True, description="Тип события (числовое или строковое представление)")
     startDate: Optional[str] = Field(None, description="Начало события (строка в формате ISO datetime)")
     endDate: Optional[str] = Field(None, description="Окончание события (строка в формате ISO datetime)")
     valueFuel: Optional[float] = Field(None, description="Количество (объем топлива)")
@@ -217,7 +230,7 @@ class FuelEventSchema(APIBaseModel):
     fuelEnd: Optional[float] = Field(None, description="Уровень топлива на конец события")
 
 
-class VehicleFuelInOutDataSchema(APIBaseModel):
+class VehicleFuelInOutDataSchema(ReportPeriodSchema):
     """
     Модель для данных о заправках и сливах по одному ТС за период.
     :param start: Начало периода отчета (строка в формате ISO datetime)
@@ -227,8 +240,6 @@ class VehicleFuelInOutDataSchema(APIBaseModel):
     :param model: Модель объекта
     :param fuels: Массив данных по заправкам и сливам (список FuelEventSchema)
     """
-    start: Optional[str] = Field(None, description="Начало периода")
-    end: Optional[str] = Field(None, description="Окончание периода")
     vehicleId: Optional[int] = Field(None, description="ID объекта")
     name: Optional[str] = Field(None, description="Имя объекта")
     model: Optional[str] = Field(None, description="Модель объекта")
@@ -241,7 +252,7 @@ class VehicleFuelInOutDataSchema(APIBaseModel):
 # --- POST /api/v3/vehicles/moveStop ---
 
 
-class MoveStopRequestSchema(APIBaseModel):
+class MoveStopRequestSchema(TimeRangeRequestSchema):
     """
     Модель для запроса данных по событиям движения и стоянок.
     :param vehicleIds: Список ID объектов
@@ -249,10 +260,6 @@ class MoveStopRequestSchema(APIBaseModel):
     :param to_datetime: Дата и время окончания запроса (строка в формате ISO datetime)
     :param timezone: Временная зона, по умолчанию UTC+3
     """
-    vehicleIds: List[int] = Field(description="Список ID объектов")
-    from_datetime: str = Field(alias="from", description="Дата и время начала запроса")
-    to_datetime: str = Field(alias="to", description="Дата и время окончания запроса")
-    timezone: Optional[int] = Field(None, description="Временная зона, по умолчанию UTC+3")
 
 
 class MoveEventSchema(APIBaseModel):
@@ -457,11 +464,11 @@ class VehicleSensorSchema(APIBaseModel):
     id: Optional[str] = Field(None, description="ID датчика")
     name: Optional[str] = Field(None, description="Имя датчика")
     type: Optional[Union[int, str]] = Field(None, description="Тип датчика (числовое или строковое представление)")
-    inputType: Optional[Union[int, str]] = Field(None, description="Тип входа (числовое или строковое представление)")
+    inputType: Optional[str] = Field(None, coerce_numbers_to_str=True, description="Тип входа (числовое или строковое представление)")
     pseudonym: Optional[str] = Field(None, description="Псевдоним")
     showInTooltip: Optional[bool] = Field(None, description="Отображать в подсказке")
     showLastValid: Optional[bool] = Field(None, description="Отображать последнее валидное значение")
-    gradeType: Optional[Union[int, str]] = Field(None, description="Тип тарировки (числовое или строковое представление)")
+    gradeType: Optional[str] = Field(None, coerce_numbers_to_str=True, description="Тип тарировки (числовое или строковое представление)")
     gradesTables: Optional[List[VehicleSensorGradeTableSchema]] = Field(None, description="Массив таблиц тарировки")
     kind: Optional[str] = Field(None)
     inputNumber: Optional[int] = Field(None)
@@ -472,9 +479,10 @@ class VehicleSensorSchema(APIBaseModel):
     showWithoutIgn: Optional[bool] = Field(None)
     agrFunction: Optional[str] = Field(None)
     expr: Optional[str] = Field(None, description="Выражение для композитного датчика")
-    customParams: Optional[Dict[str, Any]] = Field(None, description="Пользовательские параметры")
+    # Сохраняются в БД как JSON без разбора: Any не проверяет вложенные значения
+    customParams: Optional[Any] = Field(None, description="Пользовательские параметры")
     summaryMaxValue: Optional[Any] = Field(None)
-    valueIntervals: Optional[List[Any]] = Field(None)
+    valueIntervals: Optional[Any] = Field(None)
     disableEmissionsValidation: Optional[bool] = Field(None)
     unitOfMeasure: Optional[int] = Field(None)
     medianDegree: Optional[int] = Field(None, description="Степень медианного сглаживания (для ДУТ)")
@@ -598,7 +606,7 @@ class VehicleDetailResponseSchema(APIBaseModel):
     consumptionIdleSeasonalBegin: Optional[str] = Field(None)
     consumptionIdleSeasonalEnd: Optional[str] = Field(None)
 
-    mileageCalcMethod: Optional[Union[int,str]] = Field(None, description="0 - gps, 1 - датчик зажигания, или строка из API") # API может вернуть строку "ByGps"
+    mileageCalcMethod: Optional[str] = Field(None, coerce_numbers_to_str=True, description="0 - gps, 1 - датчик зажигания, или строка из API") # API может вернуть строку "ByGps"
     mileageCoeff: Optional[float] = Field(None)
     locationByCellId: Optional[bool] = Field(None, description="Определение местоположения по данным LBS")
     dottedLineTrackWhenNoCoords: Optional[bool] = Field(None)
@@ -615,7 +623,7 @@ class VehicleDetailResponseSchema(APIBaseModel):
     statusHistory: Optional[List[VehicleStatusHistoryItemSchema]] = Field(None, description="История статусов")
     
     highlightSensorGuid: Optional[str] = Field(None)
-    motohoursCalcMethod: Optional[Union[int, str]] = Field(None, description="0 - По датчику зажигания..., или строка из API") # API может вернуть строку "ByIgnitionSensor"
+    motohoursCalcMethod: Optional[str] = Field(None, coerce_numbers_to_str=True, description="0 - По датчику зажигания..., или строка из API") # API может вернуть строку "ByIgnitionSensor"
 
 
 # --- POST /api/v3/vehicles/find ---
@@ -713,10 +721,21 @@ class VehicleListItemSchema(APIBaseModel):
     modelName: Optional[str] = Field(None, description="Наименование модели объекта")
     unitId: Optional[str] = Field(None, description="Идентификатор подразделения")
     unitName: Optional[str] = Field(None, description="Наименование подразделения")
-    status: Optional[Union[str, int]] = Field(None, description="Статус объекта")
+    status: Optional[str] = Field(None, coerce_numbers_to_str=True, description="Статус объекта")
     createdAt: Optional[str] = Field(None, description="Дата создания объектов")
     customFields: Optional[List[VehicleListCustomFieldItemSchema]] = Field(None, description="Произвольные поля")
     vehicleGroups: Optional[List[VehicleListGroupItemSchema]] = Field(None, description="Группы ТС")
 
 
 # Тип ответа для POST /api/v3/vehicles/find: List[VehicleListItemSchema]
+
+
+class VehicleListIdsSchema(APIBaseModel):
+    """
+    Облегченная модель элемента ответа поиска ТС: только идентификаторы.
+    Остальные поля ответа пропускаются без построения вложенных моделей.
+    :param vehicleId: Идентификатор объекта
+    :param parentId: Идентификатор клиента-родителя
+    """
+    vehicleId: Optional[int] = Field(None, description="Идентификатор объекта")
+    parentId: Optional[str] = Field(None, description="Идентификатор клиента-родителя")